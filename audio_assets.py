@@ -0,0 +1,191 @@
+##################################################################################################################
+##                                    SOUNDTRACK ASSETS                                                         ##
+##################################################################################################################
+
+# soundtracks/manifest.json lists the source soundtracks with the volume each one must play at ("sources"), and the
+# variants built from them for each platform profile ("profiles"). The volume of each source is baked into the
+# samples, so variants play at full volume and quiet tracks compress into much smaller files, and they are transcoded
+# to Ogg Vorbis at the bitrate of the profile. Variants are built when packaging the app, which then leaves out the
+# sources (see pyinstaller.spec and p4a_hooks.py), or by running "python audio_assets.py". Both need ffmpeg, and only
+# rebuild the variants whose source or encoding settings changed. At runtime, a soundtrack without a variant for the
+# profile of the platform (e.g. running from the sources, variants not built yet) is played from its source.
+
+import argparse
+import hashlib
+import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from math import log10
+from os import cpu_count, makedirs, path, remove, replace
+from typing import Optional
+
+MANIFEST_PATH: str = "soundtracks/manifest.json"
+# encoding settings of the variants of each profile, passed to ffmpeg
+PROFILES: dict[str, dict[str, str]] = {"android": {"quality": "1", "sample_rate": "44100"},  # about 80 kbps
+                                       "desktop": {"quality": "4", "sample_rate": "44100"}}  # about 128 kbps
+VARIANT_EXTENSION: str = ".ogg"
+
+
+def get_profile() -> str:
+    """
+    Gets the profile of the platform the app runs on
+    :return: name of the profile, see PROFILES
+    """
+    from kivy.utils import platform  # not at the top, Kivy would parse the arguments of the build
+    return "android" if platform in ("android", "ios") else "desktop"
+
+
+class AudioManifest:
+    """
+    Files and volumes of the soundtracks for one profile, as listed in soundtracks/manifest.json
+    """
+    def __init__(self, directory: str, manifest: dict, profile: str):
+        self.directory: str = directory
+        self.profile: str = profile
+        self.sources: dict[str, float] = manifest.get("sources", {})  # name: volume of the source
+        self.variants: dict[str, dict] = manifest.get("profiles", {}).get(profile, {})  # name: variant
+
+    @classmethod
+    def read(cls, directory: str, profile: Optional[str] = None) -> "AudioManifest":
+        """
+        Reads the manifest of a directory of soundtracks
+        :param directory: directory of the soundtracks and of manifest.json
+        :param profile: profile of the variants to play, the one of the platform by default
+        :return: the manifest, empty if there is no manifest.json
+        """
+        manifest_path: str = path.join(directory, path.basename(MANIFEST_PATH))
+        manifest: dict = {}
+        if path.isfile(manifest_path):
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        return cls(directory, manifest, profile or get_profile())
+
+    def _get_variant(self, name: str) -> Optional[dict]:
+        variant: Optional[dict] = self.variants.get(name)
+        if variant is not None and path.isfile(path.join(self.directory, variant["file"])):
+            return variant
+        return None
+
+    def get_path(self, name: str) -> str:
+        """
+        Gets the file to load for a soundtrack: its variant for the profile, or its source if it has no variant
+        :param name: name of the soundtrack (its source file, e.g. river.mp3)
+        :return: path to the file
+        """
+        variant: Optional[dict] = self._get_variant(name)
+        return path.join(self.directory, name if variant is None else variant["file"])
+
+    def get_volume(self, name: str) -> float:
+        """
+        Gets the volume a soundtrack plays at
+        :param name: name of the soundtrack
+        :return: volume, 1.0 for variants (volume already baked)
+        """
+        variant: Optional[dict] = self._get_variant(name)
+        return self.sources.get(name, 1.0) if variant is None else variant["volume"]
+
+
+def get_variant_key(source_path: str, volume: float, settings: dict[str, str]) -> str:
+    """
+    Gets the key identifying a variant: its source, the volume baked and its encoding settings
+    :param source_path: path to the source soundtrack
+    :param volume: volume of the source
+    :param settings: encoding settings of the profile
+    :return: hex digest identifying the variant
+    """
+    digest = hashlib.sha1()
+    with open(source_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    digest.update(json.dumps([volume, settings], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def transcode(source_path: str, variant_path: str, volume: float, settings: dict[str, str],
+              ffmpeg: str = "ffmpeg") -> None:
+    """
+    Bakes the volume into a soundtrack and transcodes it to Ogg Vorbis. The variant is written under a temporary name
+    and then renamed
+    :param source_path: path to the source soundtrack
+    :param variant_path: path of the variant
+    :param volume: volume of the source, from 0 to 1
+    :param settings: encoding settings of the profile
+    :param ffmpeg: ffmpeg executable
+    :return: None
+    """
+    tmp_path: str = variant_path + ".tmp" + VARIANT_EXTENSION  # ffmpeg picks the format from the extension
+    gain: float = 20 * log10(volume) if volume > 0 else -120.0  # in dB
+    try:
+        subprocess.run([ffmpeg, "-y", "-v", "error", "-i", source_path, "-map", "0:a", "-map_metadata", "-1",
+                        "-af", f"volume={gain:.2f}dB", "-c:a", "libvorbis", "-q:a", settings["quality"],
+                        "-ar", settings["sample_rate"], tmp_path], check=True)
+        replace(tmp_path, variant_path)
+    finally:
+        if path.exists(tmp_path):
+            remove(tmp_path)
+
+
+def build_variants(directory: str, profiles: tuple[str, ...] = tuple(PROFILES), ffmpeg: str = "ffmpeg",
+                   workers: int = cpu_count() or 1) -> dict:
+    """
+    Builds the variants of the sources listed in the manifest of a directory, and writes the updated manifest
+    :param directory: directory of the soundtracks and of manifest.json
+    :param profiles: profiles to build
+    :param ffmpeg: ffmpeg executable
+    :param workers: number of ffmpeg processes run at the same time
+    :return: the updated manifest
+    """
+    manifest_path: str = path.join(directory, path.basename(MANIFEST_PATH))
+    with open(manifest_path, "r") as f:
+        manifest: dict = json.load(f)
+    sources: dict[str, float] = manifest["sources"]
+    jobs: list[tuple[str, str, str, float, dict[str, str], str]] = []  # (profile, name, source, volume, settings, key)
+
+    for profile in profiles:
+        variants: dict[str, dict] = manifest.setdefault("profiles", {}).setdefault(profile, {})
+        for name in list(variants):
+            if name not in sources:
+                del variants[name]
+        for name, volume in sources.items():
+            source_path: str = path.join(directory, name)
+            if not path.isfile(source_path):  # e.g. soundtrack not released yet, played from its source if it comes
+                variants.pop(name, None)
+                continue
+            key: str = get_variant_key(source_path, volume, PROFILES[profile])
+            variant: Optional[dict] = variants.get(name)
+            if (variant is not None and variant["key"] == key and
+                    path.isfile(path.join(directory, variant["file"]))):
+                continue
+            jobs.append((profile, name, source_path, volume, PROFILES[profile], key))
+
+    def run(job: tuple[str, str, str, float, dict[str, str], str]) -> tuple[str, str, dict]:
+        profile, name, source_path, volume, settings, key = job
+        variant_file: str = f"{profile}/{path.splitext(name)[0]}{VARIANT_EXTENSION}"
+        makedirs(path.join(directory, profile), exist_ok=True)
+        transcode(source_path, path.join(directory, variant_file), volume, settings, ffmpeg)
+        return profile, name, {"file": variant_file, "volume": 1.0, "key": key,
+                               "bytes": path.getsize(path.join(directory, variant_file))}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs) or 1))) as pool:  # ffmpeg runs apart anyway
+        for profile, name, variant in pool.map(run, jobs):
+            manifest["profiles"][profile][name] = variant
+            source_size: int = path.getsize(path.join(directory, name))
+            print(f"{name} -> {variant['file']} ({source_size // 1024} KB -> {variant['bytes'] // 1024} KB)")
+
+    tmp_path: str = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+        f.write("\n")
+    replace(tmp_path, manifest_path)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Builds the soundtrack variants listed in the manifest")
+    parser.add_argument("--directory", default=path.dirname(MANIFEST_PATH), help="directory of the soundtracks")
+    parser.add_argument("--profiles", nargs="*", default=list(PROFILES), choices=list(PROFILES),
+                        help="profiles to build")
+    parser.add_argument("--ffmpeg", default="ffmpeg", help="ffmpeg executable")
+    parser.add_argument("--workers", type=int, default=cpu_count() or 1, help="number of ffmpeg processes")
+    args = parser.parse_args()
+    build_variants(args.directory, tuple(args.profiles), args.ffmpeg, args.workers)
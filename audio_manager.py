@@ -0,0 +1,282 @@
+from collections import OrderedDict
+from functools import partial
+from itertools import count
+from os import path
+from queue import PriorityQueue
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Optional
+
+from kivy.clock import Clock, ClockEvent
+from kivy.core.audio import SoundLoader, Sound
+from kivy.logger import Logger
+
+import tracing
+from audio_assets import AudioManifest
+from story_graph import StoryGraph
+
+PLAY_PRIORITY: int = 0  # soundtracks requested by play() are loaded before prefetched ones
+PREFETCH_PRIORITY: int = 1
+
+
+class AudioManager:
+    """
+    Loads and plays soundtracks without blocking the main thread. Soundtracks are loaded by a background worker,
+    either when play() needs them or in advance: soundtracks of the scenes reachable within prefetch_depth links of
+    the current scene are prefetched. Once the loaded soundtracks exceed memory_budget (estimated from their file
+    sizes), unreachable and then least recently used ones are unloaded. Changes of soundtrack are crossfades.
+    Files and volumes of the soundtracks come from their manifest (see audio_assets.py)
+    """
+    def __init__(self, directory: str, memory_budget: int = 8 * 1024 * 1024, prefetch_depth: int = 2,
+                 profile: Optional[str] = None):
+        self.directory: str = directory
+        self.manifest: AudioManifest = AudioManifest.read(directory, profile)  # variants of the platform profile
+        self.memory_budget: int = memory_budget  # in bytes
+        self.prefetch_depth: int = prefetch_depth  # in links
+        self.graph: Optional[StoryGraph] = None
+        self.sounds: OrderedDict[str, Sound] = OrderedDict()  # loaded soundtracks, least recently used first
+        self.sizes: dict[str, int] = {}  # estimated memory of each loaded soundtrack
+        self.pinned: set[str] = set()  # soundtracks never unloaded
+        self.reachable: set[str] = set()  # soundtracks reachable from the current scene
+        self.unavailable: set[str] = set()  # soundtracks that could not be loaded, never retried
+        self.current: Optional[str] = None  # soundtrack playing (or about to play, if still loading)
+        self.loop: bool = False  # if the current soundtrack plays in loop
+        self.fade_duration: float = 0.0  # duration in seconds of the fading in of the current soundtrack
+        self._fades: dict[str, tuple[float, float, float, float]] = {}  # name: (from, to, start time, duration)
+        self._fade_event: Optional[ClockEvent] = None
+        self._pending: set[str] = set()  # soundtracks queued for the worker
+        self._in_flight: set[str] = set()  # soundtracks loaded by the worker, not registered by the main thread yet
+        self._lock: Lock = Lock()  # guards _pending and _in_flight, the only state shared with the worker
+        self._queue: PriorityQueue = PriorityQueue()
+        self._order = count()  # keeps the queue FIFO within the same priority
+        self._worker: Optional[Thread] = None
+
+    ################################################## LOADING ##################################################
+
+    @tracing.traced()
+    def load(self, name: str) -> Optional[Sound]:
+        """
+        Loads (decodes) a soundtrack without registering it, so it may run outside the main thread (see put()).
+        Called from the worker and from the loading pipeline of FogApp.setup_game()
+        :param name: name of the soundtrack file
+        :return: the loaded Sound, or None if it could not be loaded
+        """
+        filename: str = self.manifest.get_path(name)
+        if not path.isfile(filename):
+            return None
+        return SoundLoader.load(filename)
+
+    def _add(self, name: str, sound: Sound, used: bool) -> None:
+        """
+        Registers a loaded soundtrack and unloads others if the memory budget is exceeded
+        :param name: name of the soundtrack file
+        :param sound: loaded Sound
+        :param used: if False (prefetched, not played yet), the soundtrack is registered as least recently used
+        :return: None
+        """
+        sound.volume = self.manifest.get_volume(name)
+        self.sounds[name] = sound
+        self.sounds.move_to_end(name, last=used)
+        self.sizes[name] = path.getsize(self.manifest.get_path(name))
+        self._evict()
+
+    def put(self, name: str, sound: Optional[Sound], pinned: bool = False) -> None:
+        """
+        Registers a soundtrack loaded with load() (e.g. by the loading pipeline of FogApp.setup_game()) as used
+        :param name: name of the soundtrack file
+        :param sound: loaded Sound, None if it could not be loaded
+        :param pinned: if True, the soundtrack will never be unloaded
+        :return: None
+        """
+        if pinned:
+            self.pinned.add(name)
+        if sound is None:
+            self.unavailable.add(name)
+        elif name in self.sounds:
+            sound.unload()  # loaded meanwhile by the worker
+        else:
+            self._add(name, sound, used=True)
+
+    def _request(self, name: str, priority: int) -> None:
+        """
+        Queues a soundtrack to be loaded by the worker (started if needed)
+        :param name: name of the soundtrack file
+        :param priority: PLAY_PRIORITY or PREFETCH_PRIORITY
+        :return: None
+        """
+        if name in self.sounds or name in self.unavailable:
+            return
+        if name in self._pending and priority == PREFETCH_PRIORITY:
+            return
+        with self._lock:
+            self._pending.add(name)  # a soundtrack queued twice (prefetched, then played) is only loaded once
+        self._queue.put((priority, next(self._order), name))
+
+        if self._worker is None:
+            self._worker = Thread(target=self._work, daemon=True)
+            self._worker.start()
+
+    def prefetch(self, scene_id: int) -> None:
+        """
+        Queues the soundtracks reachable from a scene to be loaded in the background
+        :param scene_id: id of the current scene
+        :return: None
+        """
+        scene_ids: set[int] = self.graph.get_reachable_ids(scene_id, self.prefetch_depth)
+        self.reachable = {self.graph.get_scene(reachable_id).soundtrack for reachable_id in scene_ids}
+
+        for name in self.reachable:
+            self._request(name, PREFETCH_PRIORITY)
+        self._evict()
+
+    def _work(self) -> None:
+        """
+        Worker loop loading queued soundtracks. Results are handed over to the main thread
+        :return: None
+        """
+        while True:
+            priority, order, name = self._queue.get()
+            with self._lock:
+                if name not in self._pending or name in self._in_flight:  # queued twice, loaded by the other entry
+                    continue
+                self._in_flight.add(name)
+            try:
+                sound: Optional[Sound] = self.load(name)
+            except Exception as error:  # e.g. a damaged file. Marked unavailable, the worker goes on with the others
+                Logger.warning(f"AudioManager: could not load {name}: {error}")
+                sound = None
+            Clock.schedule_once(partial(self._on_loaded, name, sound))
+
+    def _on_loaded(self, name: str, sound: Optional[Sound], dt) -> None:
+        """
+        Registers a soundtrack loaded by the worker, unless it is already loaded or no longer needed, and starts
+        playing it if it is the current soundtrack
+        :param name: name of the soundtrack file
+        :param sound: loaded Sound (None if it could not be loaded)
+        :param dt: delta time
+        :return: None
+        """
+        with self._lock:
+            self._pending.discard(name)
+            self._in_flight.discard(name)
+        if sound is None:
+            self.unavailable.add(name)
+            return
+        if name in self.sounds or (name not in self.reachable and name != self.current):
+            sound.unload()
+            return
+        self._add(name, sound, used=name == self.current)
+        if name == self.current:
+            self._start(name)
+
+    def _evict(self) -> None:
+        """
+        Unloads soundtracks until the memory budget is met, unreachable ones first and then least recently used.
+        Pinned, current and playing (e.g. fading out) soundtracks are never unloaded
+        :return: None
+        """
+        used: int = sum(self.sizes.values())
+        candidates: list[str] = ([name for name in self.sounds if name not in self.reachable] +
+                                 [name for name in self.sounds if name in self.reachable])
+        for name in candidates:
+            if used <= self.memory_budget:
+                break
+            if name in self.pinned or name == self.current or self.sounds[name].state == "play":
+                continue
+            self.sounds.pop(name).unload()
+            used -= self.sizes.pop(name)
+
+    ################################################## PLAYING ##################################################
+
+    def play(self, name: str, loop: bool, fade: float) -> None:
+        """
+        Crossfades from the current soundtrack to another one. Never blocks: if the soundtrack is not loaded yet,
+        it starts fading in as soon as the worker has loaded it
+        :param name: name of the soundtrack file
+        :param loop: if True, the soundtrack plays in loop
+        :param fade: duration in seconds of the crossfade
+        :return: None
+        """
+        if self.current is not None and self.current != name:
+            self._fade_out(self.current, fade)
+        self.current = name
+        self.loop = loop
+        self.fade_duration = fade
+
+        if name in self.sounds:
+            self.sounds.move_to_end(name)
+            self._start(name)
+        else:
+            self._request(name, PLAY_PRIORITY)
+
+    def stop(self, fade: float) -> None:
+        """
+        Fades out the current soundtrack, if any
+        :param fade: duration in seconds of the fading
+        :return: None
+        """
+        if self.current is not None:
+            self._fade_out(self.current, fade)
+        self.current = None
+
+    def _start(self, name: str) -> None:
+        """
+        Starts playing (if not playing yet) and fades in a loaded soundtrack up to its volume
+        :param name: name of the soundtrack file
+        :return: None
+        """
+        sound: Sound = self.sounds[name]
+        sound.loop = self.loop
+        if sound.state != "play":
+            sound.volume = 0.0
+            sound.play()
+        self._fade(name, self.manifest.get_volume(name), self.fade_duration)
+
+    def _fade_out(self, name: str, duration: float) -> None:
+        """
+        Fades out a soundtrack, which is stopped at the end of the fading
+        :param name: name of the soundtrack file
+        :param duration: duration in seconds of the fading
+        :return: None
+        """
+        if name in self.sounds and self.sounds[name].state == "play":
+            self._fade(name, 0.0, duration)
+
+    def _fade(self, name: str, volume: float, duration: float) -> None:
+        """
+        Starts changing the volume of a soundtrack progressively, replacing any fading already going on
+        :param name: name of the soundtrack file
+        :param volume: volume at the end of the fading
+        :param duration: duration in seconds of the fading
+        :return: None
+        """
+        self._fades[name] = (self.sounds[name].volume, volume, perf_counter(), duration)
+        if self._fade_event is None:
+            self._fade_event = Clock.schedule_interval(self._update_fades, 0)  # every frame
+        self._update_fades(0)
+
+    def _update_fades(self, dt) -> Optional[bool]:
+        """
+        Updates the volume of the soundtracks being faded. Soundtracks faded out are stopped
+        :param dt: delta time
+        :return: False once there is nothing left to fade, which unschedules the method
+        """
+        now: float = perf_counter()
+        for name, (start_volume, end_volume, start_time, duration) in list(self._fades.items()):
+            progress: float = 1.0 if duration <= 0 else min(1.0, (now - start_time) / duration)
+            sound: Optional[Sound] = self.sounds.get(name)
+            if sound is None:  # unloaded meanwhile
+                del self._fades[name]
+                continue
+            sound.volume = start_volume + (end_volume - start_volume) * progress
+
+            if progress == 1.0:
+                del self._fades[name]
+                if end_volume == 0.0:
+                    sound.stop()
+                    sound.volume = self.manifest.get_volume(name)
+
+        if not self._fades and self._fade_event is not None:
+            self._fade_event.cancel()
+            self._fade_event = None
+            return False
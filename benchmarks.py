@@ -0,0 +1,153 @@
+##################################################################################################################
+##                                    MICRO-BENCHMARKS                                                          ##
+##################################################################################################################
+
+# Times the story logic without a window (formatting, variables, intro, conditions, scene resolution and story
+# loading) for both bundled languages and compares each result with the baseline stored in benchmarks_baseline.json.
+# Results are stored relative to a calibration loop of plain Python timed along each run, so a baseline saved on
+# one machine still holds on another one (or on the same one under a different load). "python benchmarks.py" fails
+# (exit code 1) if any relative result exceeds its baseline times the tolerance. "python benchmarks.py --save"
+# stores the current results as the new baseline. The calibration does not follow every difference between
+# machines (e.g. caches, Python builds), hence the wide default tolerance: the check catches regressions of the
+# story logic (e.g. a scan or a copy per call), not changes of a few percent.
+
+import argparse
+import json
+import statistics
+import sys
+import timeit
+from os import path
+from typing import Callable
+
+import json_utils
+import story_cache
+from story_engine import StoryEngine
+from story_graph import StoryGraph
+from story_model import StoryModel
+
+BASELINE_PATH: str = "benchmarks_baseline.json"
+STORIES: dict[str, str] = {"english": "languages/Fog.json", "spanish": "languages/Niebla.json"}
+TOLERANCE: float = 2.0  # max ratio between a relative result and its baseline
+REPEAT: int = 5  # runs of each benchmark, alternated with runs of the calibration loop to filter out noise
+
+
+def calibration_loop() -> list[tuple[str, int]]:
+    """
+    Fixed workload of dict, string and list operations, the ones the story logic is made of
+    :return: the workload result
+    """
+    counts: dict[str, int] = {}
+    for i in range(2000):
+        key: str = f"variable_{i % 97}"
+        counts[key] = counts.get(key, 0) + i
+    return sorted(counts.items())
+
+
+def measure(function: Callable, repeat: int = REPEAT) -> tuple[float, float]:
+    """
+    Times a function and the calibration loop alternately, so both run under the same load
+    :param function: function to time, called without arguments
+    :param repeat: number of runs of each
+    :return: seconds per call (fastest run), and time relative to the calibration loop (median of the runs)
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()  # enough calls to last at least 0.2 seconds
+    calibration = timeit.Timer(calibration_loop)
+    calibration_number, _ = calibration.autorange()
+    times: list[float] = []
+    relative_times: list[float] = []
+    for _ in range(repeat):
+        calibration_time: float = calibration.timeit(calibration_number) / calibration_number
+        times.append(timer.timeit(number) / number)
+        relative_times.append(times[-1] / calibration_time)
+    return min(times), statistics.median(relative_times)
+
+
+def get_benchmarks(source_path: str) -> dict[str, Callable]:
+    """
+    Prepares the benchmarks of a story
+    :param source_path: path to the JSON containing the story
+    :return: {name: function to time}
+    """
+    with open(source_path, "rb") as f:
+        raw_story: bytes = f.read()
+    scenes: list[dict] = json.loads(raw_story)["scenes"]
+    texts: list[str] = [text if text[:2] == "<p" else "<p>" + text + "</p>"
+                        for text in (section["text"] for scene in scenes for section in scene["sections"])]
+    compiled_story: dict = story_cache.compile_story(raw_story)
+    graph = StoryGraph(compiled_story["scenes"], intro_id=compiled_story["intro_id"],
+                       variables=compiled_story["variables"])
+    engine = StoryEngine(graph)
+    compiled_conditions: list[tuple] = [rules[0] for scene_id in graph.scenes
+                                        for rules in graph.get_section_rules(scene_id) + graph.get_link_rules(scene_id)]
+
+    def setup_story():  # what FogApp.setup_game() does with the story, formatting lazily (see FogApp.lazy_formatting)
+        story_graph, story_texts = StoryModel({source_path: source_path}, formatted=False).get(source_path)
+        StoryEngine(story_graph)
+
+    return {"format_kivy": lambda: [json_utils.format_kivy(text) for text in texts],
+            "get_variables": lambda: json_utils.get_variables(scenes),
+            "get_intro": lambda: json_utils.get_intro(scenes, id_only=True),
+            "meets_conditions": lambda: [engine.variables.meets(item) for item in compiled_conditions],
+            "resolve_scenes": lambda: [engine.resolve(scene, engine.variables.copy())
+                                       for scene in graph.scenes.values()],
+            "compile_story": lambda: story_cache.compile_story(raw_story),
+            "setup_story": setup_story}
+
+
+def read_baseline(baseline_path: str) -> dict[str, float]:
+    """
+    Reads the stored baseline
+    :param baseline_path: path to the baseline file
+    :return: {benchmark name: time per call relative to the calibration loop}, empty if there is no baseline
+    """
+    if not path.isfile(baseline_path):
+        return {}
+    with open(baseline_path, "r") as f:
+        return json.load(f)
+
+
+def run(baseline_path: str, tolerance: float, save: bool, pattern: str) -> bool:
+    """
+    Runs the benchmarks, prints the results and compares them with the baseline (or saves them as baseline)
+    :param baseline_path: path to the baseline file
+    :param tolerance: max ratio between a relative result and its baseline
+    :param save: if True, results are stored as the new baseline instead of being compared
+    :param pattern: only benchmarks whose name contains it are run
+    :return: True if no benchmark is slower than allowed, else False
+    """
+    baseline: dict[str, float] = read_baseline(baseline_path)
+    results: dict[str, float] = {}  # relative to the calibration loop
+    passed: bool = True
+
+    print(f"{'benchmark':<32}{'time (us)':>12}{'relative':>12}{'baseline':>12}{'ratio':>8}")
+    for language, source_path in STORIES.items():
+        for name, function in get_benchmarks(source_path).items():
+            name = f"{language}/{name}"
+            if pattern not in name:
+                continue
+            time, results[name] = measure(function)
+            line: str = f"{name:<32}{time * 1e6:>12.1f}{results[name]:>12.4f}"
+            if name in baseline:
+                ratio: float = results[name] / baseline[name]
+                failed: bool = not save and ratio > tolerance
+                passed = passed and not failed
+                line += f"{baseline[name]:>12.4f}{ratio:>8.2f}" + ("  SLOWER" if failed else "")
+            print(line)
+
+    if save:
+        with open(baseline_path, "w") as f:
+            json.dump(baseline | results, f, indent=4)
+        print(f"Baseline saved -> {baseline_path}")
+    return passed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the story logic benchmarks and compares them with the baseline")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="max ratio between relative result and baseline")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="path to the baseline file")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.baseline, args.tolerance, args.save, args.filter) else 1)
@@ -18,7 +18,9 @@ package.domain = com.appsbrivalles
 source.dir = .
 
 # (list) Source files to include (leave empty to include all the files)
-source.include_exts = py,kv,json,ttf,png,mp3
+# soundtracks are not packaged from here: their variants of the android profile (ogg) are built and added to the
+# app with soundtracks/manifest.json by p4a_hooks.py (see p4a.hook), and their sources (mp3) are left out
+source.include_exts = py,kv,json,ttf,png,storycache,atlas
 
 # (list) List of inclusions using pattern matching
 #source.include_patterns = assets/*,images/*.png
@@ -27,11 +29,11 @@ source.include_exts = py,kv,json,ttf,png,mp3
 source.exclude_exts = spec,md
 
 # (list) List of directory to exclude (leave empty to not exclude anything)
-source.exclude_dirs = tests,bin,venv,legacy
+source.exclude_dirs = tests,bin,venv,legacy,converted,soundtracks/desktop,soundtracks/android
 
 # (list) List of exclusions using pattern matching
 # Do not prefix with './'
-source.exclude_patterns = saved_game.json,json_formatter.py
+source.exclude_patterns = saved_game.json,saved_game.json.tmp,saved_game.journal,saved_game.journal.tmp,json_formatter.py,benchmarks.py,benchmarks_baseline.json,story_explorer.py,p4a_hooks.py
 
 # (str) Application versioning (method 1)
 version = 3.2
@@ -341,7 +343,8 @@ android.release_artifact = aab
 #p4a.local_recipes =
 
 # (str) Filename to the hook for p4a
-#p4a.hook =
+# builds the variants of the soundtracks (needs ffmpeg) and adds them to the app, see p4a_hooks.py
+p4a.hook = p4a_hooks.py
 
 # (str) Bootstrap to use for android builds
 # Run "buildozer android p4a -- bootstraps" for a list of valid values.
@@ -0,0 +1,80 @@
+from array import array
+from typing import Iterable
+
+# Conditions and consequences are compiled once (see StoryGraph) into tuples of (slot, value) pairs, where slot
+# is the index of the variable in GameState.values. Checking them only costs as much as the item's own entries.
+Rules = tuple[tuple[int, int], ...]
+
+
+class GameState:
+    """
+    Values of the game variables, stored in a compact integer array indexed by variable slot
+    """
+    __slots__ = ("names", "slots", "values")
+
+    def __init__(self, names: Iterable[str]):
+        self.names: tuple[str, ...] = tuple(names)
+        self.slots: dict[str, int] = {name: slot for slot, name in enumerate(self.names)}
+        self.values: array = array("i", bytes(4 * len(self.names)))  # all variables start at 0
+
+    def __getitem__(self, name: str) -> int:
+        return self.values[self.slots[name]]
+
+    def meets(self, conditions: Rules) -> bool:
+        """
+        Checks if the compiled conditions of a section or link are met
+        :param conditions: compiled conditions
+        :return: True if all conditions are met (or there are none), else False
+        """
+        values = self.values
+        for slot, value in conditions:
+            if values[slot] != value:
+                return False
+        return True
+
+    def apply(self, consequences: Rules) -> None:
+        """
+        Updates the variables according to the compiled consequences of a section or link
+        :param consequences: compiled consequences
+        :return: None
+        """
+        values = self.values
+        for slot, value in consequences:
+            values[slot] = value
+
+    def reset(self) -> None:
+        """
+        Sets all variables back to 0
+        :return: None
+        """
+        self.values = array("i", bytes(4 * len(self.names)))
+
+    def copy(self) -> "GameState":
+        """
+        Copies the state without recomputing the slot table
+        :return: the copy
+        """
+        state = GameState.__new__(GameState)
+        state.names = self.names
+        state.slots = self.slots
+        state.values = array("i", self.values)
+        return state
+
+    def as_dict(self) -> dict[str, int]:
+        """
+        Gets the variables as a name to value dict (e.g. to save the game)
+        :return: dict with the value of each variable
+        """
+        return dict(zip(self.names, self.values))
+
+    def update_from_dict(self, variables: dict[str, int]) -> None:
+        """
+        Overwrites the variables with the values of a name to value dict (e.g. a saved game). Names unknown to the
+        story are ignored
+        :param variables: dict with the value of each variable
+        :return: None
+        """
+        for name, value in variables.items():
+            slot = self.slots.get(name)
+            if slot is not None:
+                self.values[slot] = int(value)
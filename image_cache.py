@@ -0,0 +1,291 @@
+##################################################################################################################
+##                                    IN-GAME PICTURES                                                          ##
+##################################################################################################################
+
+# Pictures in pics/ are packed at build time into a Kivy texture atlas (atlas/pics.atlas and its pages), so all of
+# them share a few textures. Downscaled variants of the pictures are packed into one more atlas per scale of
+# VARIANT_SCALES (e.g. atlas/pics@0.5x.atlas), and atlas/manifest.json records the size of every source picture.
+# Pictures are laid out at the size of their source in pixels, fitted to the width of the screen without its margins
+# (laid out in dp, so wider in pixels on denser screens, see FogApp.get_pictures_width()). A picture wider than that
+# is shown from the smallest variant still covering the width: its pixels are never decoded nor uploaded at full size.
+# Run "python image_cache.py" to (re)build the atlases and the manifest, which needs Pillow. Pictures missing from
+# the atlases (or all of them, if they have not been built) are loaded from their own files.
+
+import json
+import sys
+from functools import partial
+from glob import glob
+from os import makedirs, path
+from tempfile import TemporaryDirectory
+from threading import Lock, Thread
+from typing import Iterable, Optional
+
+from kivy.clock import Clock
+from kivy.core.image import ImageLoader, ImageLoaderBase
+from kivy.graphics.texture import Texture
+from kivy.logger import Logger
+
+ATLAS_PATH: str = "atlas/pics.atlas"
+ATLAS_SIZE: int = 1024  # max width and height of each page of the atlas, in pixels
+MANIFEST_NAME: str = "manifest.json"  # written next to the atlases
+VARIANT_SCALES: tuple[float, ...] = (0.5, 0.75)  # scales of the downscaled variants, relative to the source
+
+# decoded pictures, ready to be uploaded: (decoded image, {texture id: region of the image or None if whole image})
+Decoded = list[tuple[ImageLoaderBase, dict[str, Optional[list[int]]]]]
+
+
+def get_image_id(name: str) -> str:
+    """
+    Gets the id of a picture (its file name without extension, as in the atlas)
+    :param name: file name of the picture (e.g. luna.png)
+    :return: id of the picture
+    """
+    return path.splitext(path.basename(name))[0]
+
+
+def get_texture_id(image_id: str, scale: float) -> str:
+    """
+    Gets the id of the texture of a picture at a scale
+    :param image_id: id of the picture
+    :param scale: scale of the variant, 1.0 for the source
+    :return: id of the texture (e.g. luna or luna@0.5x)
+    """
+    return image_id if scale == 1.0 else f"{image_id}@{scale}x"
+
+
+def get_atlas_path(atlas_path: str, scale: float) -> str:
+    """
+    Gets the path of the atlas of the variants at a scale
+    :param atlas_path: path of the atlas of the source pictures
+    :param scale: scale of the variants, 1.0 for the sources
+    :return: path of the atlas (e.g. atlas/pics@0.5x.atlas)
+    """
+    root, extension = path.splitext(atlas_path)
+    return atlas_path if scale == 1.0 else f"{root}@{scale}x{extension}"
+
+
+def build_atlas(directory: str, atlas_path: str = ATLAS_PATH, size: int = ATLAS_SIZE,
+                scales: tuple[float, ...] = VARIANT_SCALES) -> None:
+    """
+    Packs all the pictures of a directory into a texture atlas, and their downscaled variants into one atlas per
+    scale. The size of every picture is written to the manifest
+    :param directory: directory with the pictures
+    :param atlas_path: path of the .atlas file to create. Pages, variants and manifest are written next to it
+    :param size: max width and height of each page of the atlas, in pixels
+    :param scales: scales of the variants
+    :return: None
+    """
+    from kivy.atlas import Atlas  # needs Pillow, only at build time
+    from PIL import Image
+
+    filenames: list[str] = sorted(glob(path.join(directory, "*.png")) + glob(path.join(directory, "*.jp*g")))
+    makedirs(path.dirname(atlas_path) or ".", exist_ok=True)
+    Atlas.create(path.splitext(atlas_path)[0], filenames, size)
+
+    sizes: dict[str, list[int]] = {}
+    with TemporaryDirectory() as variants_dir:
+        for scale in scales:
+            variant_filenames: list[str] = []
+            for filename in filenames:
+                with Image.open(filename) as image:
+                    sizes[get_image_id(filename)] = list(image.size)
+                    variant = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                                           Image.LANCZOS)
+                variant_filenames.append(path.join(variants_dir, f"{scale}-{path.basename(filename)}"))
+                variant.save(variant_filenames[-1])
+            Atlas.create(path.splitext(get_atlas_path(atlas_path, scale))[0], variant_filenames, size)
+            # regions are named after the files, renamed as the pictures (e.g. 0.5-luna -> luna)
+            variant_atlas_path: str = get_atlas_path(atlas_path, scale)
+            with open(variant_atlas_path, "r") as f:
+                atlas: dict[str, dict[str, list[int]]] = json.load(f)
+            atlas = {page: {image_id.split("-", 1)[1]: region for image_id, region in regions.items()}
+                     for page, regions in atlas.items()}
+            with open(variant_atlas_path, "w") as f:
+                json.dump(atlas, f)
+
+    with open(path.join(path.dirname(atlas_path), MANIFEST_NAME), "w") as f:
+        json.dump({"scales": [1.0, *sorted(scales)], "sizes": sizes}, f, indent=4)
+
+
+class ImageCache:
+    """
+    Textures of the in-game pictures, kept for the whole session. decode() decodes the atlases (and pictures not
+    packed in them) outside the main thread (see FogApp.setup_game()), register() uploads them on the main thread.
+    Pictures are then shown without I/O or texture uploads, and pictures of an atlas share the textures of its pages.
+    Each picture is shown from the smallest variant covering the width it is shown at (see get_scale()). Variants
+    needed later (e.g. after the window is resized) are decoded outside the main thread as well (see get())
+    """
+    def __init__(self, directory: str, atlas_path: str):
+        self.directory: str = directory
+        self.atlas_path: str = atlas_path
+        self.textures: dict[str, Texture] = {}  # texture id (see get_texture_id()): texture (or region of a page)
+        self.scales: tuple[float, ...] = (1.0,)  # scales of the variants built, smallest first
+        self.sizes: dict[str, tuple[int, int]] = {}  # picture id: size of the source picture
+        self._requested: set[str] = set()  # atlases decoded (or being decoded)
+        self._pending: set[str] = set()  # texture ids being decoded by get()
+        self._lock: Lock = Lock()  # decodes share self._requested, one at a time
+        self._read_manifest()
+
+    def _read_manifest(self) -> None:
+        """
+        Reads the scales of the variants and the sizes of the pictures, if the atlases have been built
+        :return: None
+        """
+        manifest_path: str = path.join(path.dirname(self.atlas_path), MANIFEST_NAME)
+        if not path.isfile(manifest_path):
+            return
+        with open(manifest_path, "r") as f:
+            manifest: dict = json.load(f)
+        self.scales = tuple(sorted(manifest["scales"]))
+        self.sizes = {image_id: (size[0], size[1]) for image_id, size in manifest["sizes"].items()}
+
+    def _read_atlas(self, atlas_path: str) -> dict[str, dict[str, list[int]]]:
+        """
+        Reads an atlas file
+        :param atlas_path: path to the atlas file
+        :return: {page file name: {picture id: [x, y, width, height]}}, empty if the atlas has not been built
+        """
+        if not path.isfile(atlas_path):
+            return {}
+        with open(atlas_path, "r") as f:
+            return json.load(f)
+
+    def get_size(self, name: str) -> Optional[tuple[int, int]]:
+        """
+        Gets the size of the source of a picture, which it is laid out at whatever variant it is shown from
+        :param name: file name of the picture (e.g. luna.png)
+        :return: width and height in pixels, None if unknown (atlases not built)
+        """
+        return self.sizes.get(get_image_id(name))
+
+    def get_scale(self, name: str, width: Optional[float]) -> float:
+        """
+        Gets the scale of the smallest variant of a picture still covering the width it is shown at
+        :param name: file name of the picture
+        :param width: width available to the picture, in pixels. None for the source picture
+        :return: scale of the variant, 1.0 for the source
+        """
+        size: Optional[tuple[int, int]] = self.get_size(name)
+        if width is None or size is None:
+            return 1.0
+        shown_width: float = min(size[0], width)  # pictures are only scaled down to fit the screen
+        return next(scale for scale in self.scales if scale == 1.0 or round(size[0] * scale) >= shown_width)
+
+    def _decode(self, names: Iterable[str], width: Optional[float], decoded_atlases: set[str]) -> Decoded:
+        """
+        Decodes pictures (no texture is created, so it can run outside the main thread)
+        :param names: file names of the pictures needed
+        :param width: width available to the pictures, see get_scale()
+        :param decoded_atlases: atlases not to decode. Atlases decoded are added to it
+        :return: decoded pictures
+        """
+        decoded: Decoded = []
+        atlases: dict[str, dict[str, dict[str, list[int]]]] = {}
+        for name in names:
+            image_id: str = get_image_id(name)
+            scale: float = self.get_scale(name, width)
+            if get_texture_id(image_id, scale) in self.textures:
+                continue
+            atlas_path: str = get_atlas_path(self.atlas_path, scale)
+            if atlas_path not in atlases:
+                atlases[atlas_path] = self._read_atlas(atlas_path)
+            if any(image_id in regions for regions in atlases[atlas_path].values()):
+                if atlas_path not in decoded_atlases:
+                    decoded_atlases.add(atlas_path)
+                    for page, regions in atlases[atlas_path].items():
+                        page_path: str = path.join(path.dirname(atlas_path), page)
+                        decoded.append((ImageLoader.load(page_path, nocache=True),
+                                        {get_texture_id(region_id, scale): region
+                                         for region_id, region in regions.items()}))
+                continue
+
+            filename: str = path.join(self.directory, name)
+            if image_id in self.textures or not path.isfile(filename):
+                continue
+            decoded.append((ImageLoader.load(filename, nocache=True), {image_id: None}))
+        return decoded
+
+    def register(self, decoded: Decoded) -> None:
+        """
+        Uploads decoded pictures to textures. Must run on the main thread
+        :param decoded: decoded pictures
+        :return: None
+        """
+        for image, regions in decoded:
+            texture: Texture = image.texture
+            for texture_id, region in regions.items():
+                if texture_id not in self.textures:
+                    self.textures[texture_id] = texture if region is None else texture.get_region(*region)
+
+    def decode(self, names: Iterable[str], width: Optional[float] = None) -> Decoded:
+        """
+        Decodes the atlases (unless decoded before) and the pictures not packed in them nor loaded yet, at the
+        variants shown at width. It may run outside the main thread. Decoded pictures are uploaded with register()
+        :param names: file names of the pictures used by the story
+        :param width: width available to the pictures, see get_scale()
+        :return: decoded pictures
+        """
+        with self._lock:
+            return self._decode(list(names), width, self._requested)
+
+    def _decode_later(self, name: str, width: Optional[float], texture_id: str) -> None:
+        """
+        Decodes the variant of a picture in a thread, and uploads it on the main thread once decoded
+        :param name: file name of the picture
+        :param width: width available to the picture, see get_scale()
+        :param texture_id: id of the texture of the variant
+        :return: None
+        """
+        try:
+            decoded: Decoded = self.decode([name], width)
+        except Exception as error:  # e.g. a damaged page. The picture keeps being shown from the texture it has
+            Logger.warning(f"ImageCache: could not decode {name}: {error}")
+            decoded = []
+        Clock.schedule_once(partial(self._on_decoded, decoded, texture_id))
+
+    def _on_decoded(self, decoded: Decoded, texture_id: str, dt) -> None:
+        self.register(decoded)
+        self._pending.discard(texture_id)
+
+    def get(self, name: str, width: Optional[float] = None) -> Optional[Texture]:
+        """
+        Gets the texture of a picture. If the variant shown at width is not loaded yet (e.g. the window was resized),
+        it is decoded outside the main thread for the next screens, and another texture of the picture is returned
+        meanwhile. Only pictures without any texture loaded are loaded right away (blocking), from their own file
+        :param name: file name of the picture (e.g. luna.png)
+        :param width: width available to the picture, see get_scale()
+        :return: the texture (of a variant, if width is passed), or None if the picture does not exist
+        """
+        image_id: str = get_image_id(name)
+        texture_id: str = get_texture_id(image_id, self.get_scale(name, width))
+        if texture_id in self.textures:
+            return self.textures[texture_id]
+        loaded: list[Texture] = [self.textures[get_texture_id(image_id, scale)] for scale in reversed(self.scales)
+                                 if get_texture_id(image_id, scale) in self.textures]  # largest first
+        if not loaded:  # e.g. a picture not used by the story, so not decoded by decode()
+            if not self._load_file(name):
+                return None
+            if texture_id == image_id:  # source needed, or atlases not built
+                return self.textures[image_id]
+            loaded = [self.textures[image_id]]
+        if texture_id not in self._pending:
+            self._pending.add(texture_id)
+            Thread(target=self._decode_later, args=(name, width, texture_id), daemon=True).start()
+        return loaded[0]
+
+    def _load_file(self, name: str) -> bool:
+        """
+        Loads a picture from its own file, on the main thread (not the pages of its atlas)
+        :param name: file name of the picture
+        :return: True if loaded, False if the file does not exist
+        """
+        filename: str = path.join(self.directory, name)
+        if not path.isfile(filename):
+            return False
+        self.register([(ImageLoader.load(filename, nocache=True), {get_image_id(name): None})])
+        return True
+
+
+if __name__ == '__main__':
+    build_atlas(sys.argv[1] if len(sys.argv) > 1 else "pics")
+    print(f"Packed pictures -> {ATLAS_PATH} and variants at {', '.join(f'{scale}x' for scale in VARIANT_SCALES)}")
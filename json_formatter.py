@@ -1,68 +1,267 @@
+##################################################################################################################
+##                                    LEGACY STORY CONVERTER                                                    ##
+##################################################################################################################
+
+# Converts Autorol exports (e.g. legacy/Fog_legacy.json: escenas/textos/enlaces...) into the schema read by the
+# game (scenes/sections/links). Exports are read as a stream, one scene at a time, and the converted story is
+# written the same way, so memory does not grow with the size of the export. Each file is converted by its own
+# process and written under a temporary name, then renamed.
+# Autorol exports know nothing about soundtracks and locations: they are taken from the scenes with the same id in
+# an already converted story (--metadata-dir) or set to --soundtrack and --location otherwise.
+# Run "python json_formatter.py legacy/*_legacy.json --output-dir converted --metadata-dir languages".
+
+import argparse
 import json
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from os import cpu_count, fsync, makedirs, path, remove, replace
+from time import perf_counter
+from typing import Any, Iterator, Optional, TextIO
+
+CHUNK_SIZE: int = 64 * 1024  # characters read at a time
+LEGACY_SUFFIX: str = "_legacy"
+DEFAULT_SOUNDTRACK: str = "bones.mp3"
+DEFAULT_LOCATION: str = "Bones"
+INDENT: int = 4  # same layout as the stories in languages/
+NUMBER_CHARACTERS: str = "0123456789+-.eE"
+
+
+class JsonStream:
+    """
+    Reads a JSON document whose root is an object one top-level entry at a time, and the items of one of its arrays
+    one at a time. Only the value being decoded is kept in memory
+    """
+    def __init__(self, file: TextIO, chunk_size: int = CHUNK_SIZE):
+        self.file: TextIO = file
+        self.chunk_size: int = chunk_size
+        self.buffer: str = ""
+        self.pos: int = 0
+        self.eof: bool = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """
+        Drops the consumed part of the buffer and reads the next chunk
+        :return: False if the end of the file was already reached
+        """
+        if self.eof:
+            return False
+        chunk: str = self.file.read(self.chunk_size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return not self.eof
+
+    def _peek(self) -> str:
+        """
+        Skips whitespace and gets the next character without consuming it
+        :return: the next character, "" at the end of the file
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def _expect(self, characters: str) -> str:
+        """
+        Consumes the next character, which must be one of characters
+        :param characters: accepted characters
+        :return: the consumed character
+        """
+        character: str = self._peek()
+        if not character or character not in characters:
+            raise ValueError(f"Expected one of {characters!r} but found {character!r}")
+        self.pos += 1
+        return character
+
+    def _value(self) -> Any:
+        """
+        Decodes the next value, reading more chunks until it is complete
+        :return: the decoded value
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number is only complete once followed by something else (e.g. 2 may be 2.5 in the next chunk)
+                if self.eof or (end < len(self.buffer) and self.buffer[end] not in NUMBER_CHARACTERS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def _array(self) -> Iterator[Any]:
+        """
+        Decodes an array one item at a time
+        :return: iterator over the items
+        """
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
+
+    def entries(self, array_key: str) -> Iterator[tuple[str, Any]]:
+        """
+        Decodes the root object
+        :param array_key: key of the array whose items are decoded one at a time
+        :return: iterator over (key, value) entries, with one (array_key, item) entry per item of that array
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key: str = self._value()
+            self._expect(":")
+            if key == array_key and self._peek() == "[":
+                for item in self._array():
+                    yield key, item
+            else:
+                yield key, self._value()
+            if self._expect(",}") == "}":
+                return
+
+
+def convert_rules(rules: list[dict], value_key: str, new_value_key: str) -> list[dict]:
+    return [{"variable": rule["variable"], new_value_key: rule[value_key]} for rule in rules]
+
+
+def convert_link(enlace: dict) -> dict:
+    return {"text": enlace["texto"],
+            "destination_scene_id": enlace["destinoExito"],
+            "consequences": convert_rules(enlace["consecuencias"], "valor", "update_to_value"),
+            "conditions": convert_rules(enlace["condiciones"], "valorComparar", "compare_with_value")}
+
+
+def convert_section(texto: dict) -> dict:
+    return {"consequences": convert_rules(texto["consecuencias"], "valor", "update_to_value"),
+            "conditions": convert_rules(texto["condiciones"], "valorComparar", "compare_with_value"),
+            "text": texto["texto"],
+            "links": [convert_link(enlace) for enlace in texto["enlaces"]]}
+
+
+def convert_scene(escena: dict, metadata: dict[int, tuple[str, str]], soundtrack: str, location: str) -> dict:
+    """
+    Maps a legacy scene to the current schema
+    :param escena: scene of the Autorol export
+    :param metadata: {scene id: (soundtrack, location)} of an already converted story
+    :param soundtrack: soundtrack of the scenes without metadata
+    :param location: location of the scenes without metadata
+    :return: the converted scene
+    """
+    soundtrack, location = metadata.get(escena["id"], (soundtrack, location))
+    return {"title": escena["titulo"],
+            "id": escena["id"],
+            "sections": [convert_section(texto) for texto in escena["textos"]],
+            "soundtrack": soundtrack,
+            "location": location}
+
+
+def read_metadata(story_path: Optional[str]) -> dict[int, tuple[str, str]]:
+    """
+    Reads the soundtrack and location of every scene of an already converted story
+    :param story_path: path to the story, may not exist
+    :return: {scene id: (soundtrack, location)}
+    """
+    if story_path is None or not path.isfile(story_path):
+        return {}
+    with open(story_path, "r", encoding="utf-8") as f:
+        return {scene["id"]: (scene["soundtrack"], scene["location"])
+                for key, scene in JsonStream(f).entries("scenes") if key == "scenes"}
+
+
+def get_output_path(legacy_path: str, output_dir: str) -> str:
+    """
+    Gets the path of the converted story (e.g. legacy/Fog_legacy.json -> <output_dir>/Fog.json)
+    :param legacy_path: path to the Autorol export
+    :param output_dir: directory of the converted stories
+    :return: path of the converted story
+    """
+    name: str = path.splitext(path.basename(legacy_path))[0].removesuffix(LEGACY_SUFFIX)
+    return path.join(output_dir, name + ".json")
+
+
+def convert_file(legacy_path: str, output_path: str, metadata_path: Optional[str] = None,
+                 soundtrack: str = DEFAULT_SOUNDTRACK, location: str = DEFAULT_LOCATION) -> int:
+    """
+    Converts an Autorol export, streaming it scene by scene
+    :param legacy_path: path to the Autorol export
+    :param output_path: path of the converted story
+    :param metadata_path: path to an already converted story to take soundtracks and locations from
+    :param soundtrack: soundtrack of the scenes without metadata
+    :param location: location of the scenes without metadata
+    :return: number of scenes converted
+    """
+    metadata: dict[int, tuple[str, str]] = read_metadata(metadata_path)
+    makedirs(path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path: str = output_path + ".tmp"
+    item_indent: str = " " * 2 * INDENT
+    scenes: int = 0
+
+    try:
+        with open(legacy_path, "r", encoding="utf-8") as source, open(tmp_path, "w") as output:
+            output.write("{")
+            entries: int = 0
+            in_scenes: bool = False
+            for key, value in JsonStream(source).entries("escenas"):
+                if key == "escenas":
+                    scene: str = json.dumps(convert_scene(value, metadata, soundtrack, location), indent=INDENT)
+                    if not in_scenes:
+                        output.write(("," if entries else "") + f'\n{" " * INDENT}"scenes": [\n')
+                        in_scenes = True
+                        entries += 1
+                    else:
+                        output.write(",\n")
+                    output.write("\n".join(item_indent + line for line in scene.split("\n")))
+                    scenes += 1
+                    continue
+                if in_scenes:
+                    output.write(f'\n{" " * INDENT}]')
+                    in_scenes = False
+                if key == "titulo":
+                    output.write(("," if entries else "") + f'\n{" " * INDENT}"title": {json.dumps(value)}')
+                    entries += 1
+                # other keys (frames, sinopsis, observaciones...) are not used by the game
+            if in_scenes:
+                output.write(f'\n{" " * INDENT}]')
+            output.write("\n}")
+            output.flush()
+            fsync(output.fileno())
+        replace(tmp_path, output_path)
+    finally:
+        if path.exists(tmp_path):
+            remove(tmp_path)
+    return scenes
+
+
+def _convert_job(job: tuple[str, str, Optional[str], str, str]) -> tuple[str, int, float]:
+    start: float = perf_counter()
+    scenes: int = convert_file(*job)
+    return job[1], scenes, perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Converts Autorol exports into stories readable by the game")
+    parser.add_argument("exports", nargs="*", help=f"Autorol exports, legacy/*{LEGACY_SUFFIX}.json by default")
+    parser.add_argument("--output-dir", default="converted", help="directory of the converted stories")
+    parser.add_argument("--metadata-dir", default=None,
+                        help="directory of converted stories (e.g. languages) to take soundtracks and locations from")
+    parser.add_argument("--soundtrack", default=DEFAULT_SOUNDTRACK, help="soundtrack of scenes without metadata")
+    parser.add_argument("--location", default=DEFAULT_LOCATION, help="location of scenes without metadata")
+    parser.add_argument("--workers", type=int, default=cpu_count() or 1, help="number of processes")
+    args = parser.parse_args()
 
-with open("languages/Niebla.json", "r") as file:
-    data = json.load(file)
-
-"""keys_to_delete = ["frames", "sinopsis", "observaciones", "control", "tipo"]
-keys_to_delete_esc = ["codigo", "estado", "control", "tipo"]
-keys_to_delete_textos = ["test", "ancho", "posicion", "titulo"]
-keys_to_delete_enlaces = ["ancho", "extra", "frame", "destinoFallo", "posicion", "siempreVisible", "test"]
-keys_to_delete_consecuencias = ["control", "especial", "enlaceId", "textoId", "descripcion", "escenaCodigo", "slug", "orden", "accion", "tipo", "tipoId", "escenaId"]
-keys_to_delete_condiciones = ["control", "enlaceId", "textoId", "descripcion", "escenaCodigo", "slug", "tipo", "tipoId", "escenaId", "valor"]
-keys_to_delete_enl_cond = ["control",  "enlaceId", "textoId", "descripcion", "escenaCodigo", "slug", "tipo", "tipoId", "escenaId", "valor"]
-keys_to_delete_enl_cons = ["control", "especial", "enlaceId", "textoId", "descripcion", "escenaCodigo", "slug", "orden", "accion", "tipo", "tipoId", "escenaId"]
-
-data = {key:value for key,value in data.items() if key not in keys_to_delete}
-
-data["escenas"] = [
-    {
-        **{k: v for k, v in escena.items()
-           if k not in keys_to_delete_esc and k not in ("textos", "enlaces")},
-
-        "textos": [
-            {
-                **{k: v for k, v in texto.items()
-                   if k not in keys_to_delete_textos and k != "enlaces"},
-
-                "enlaces": [
-                    {k: v for k, v in enlace.items()
-                     if k not in keys_to_delete_enlaces}
-                    for enlace in texto["enlaces"]
-                ],
-                "consecuencias": [
-                    {k: v for k, v in consecuencia.items()
-                     if k not in keys_to_delete_consecuencias}
-                    for consecuencia in texto["consecuencias"]
-                ],
-
-                "condiciones": [
-                    {k: v for k, v in condicion.items()
-                     if k not in keys_to_delete_condiciones}
-                    for condicion in texto["condiciones"]
-                ]
-            }
-            for texto in escena.get("textos", [])
-        ]
-    }
-    for escena in data.get("escenas", [])
-]
-
-
-for escena in data["escenas"]:
-    for texto in escena["textos"]:
-        for enlace in texto["enlaces"]:
-            enlace["condiciones"] = [
-                {k: v for k, v in cond.items() if k not in keys_to_delete_enl_cond}
-                for cond in enlace["condiciones"]
-            ]
-
-            enlace["consecuencias"] = [
-                {k: v for k, v in cons.items() if k not in keys_to_delete_enl_cons}
-                for cons in enlace["consecuencias"]
-            ]"""
-
-for scene in data["scenes"]:
-    scene["location"] = "bones"
-
-with open("languages/Niebla.json", "w") as file2:
-    json.dump(data, file2, indent=4)
\ No newline at end of file
+    exports: list[str] = args.exports or sorted(glob(f"legacy/*{LEGACY_SUFFIX}.json"))
+    jobs: list[tuple[str, str, Optional[str], str, str]] = [
+        (export, get_output_path(export, args.output_dir),
+         get_output_path(export, args.metadata_dir) if args.metadata_dir else None, args.soundtrack, args.location)
+        for export in exports]
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(jobs)))) as pool:
+        for output_path, scenes, seconds in pool.map(_convert_job, jobs):
+            print(f"Converted {scenes} scenes -> {output_path} ({seconds:.2f} s)")
@@ -5,6 +5,8 @@
 
 import json
 import re
+from sys import intern
+from typing import NamedTuple, Optional, Sequence
 
 def read_json(path):
 
@@ -23,15 +25,27 @@ def format_kivy_all(jsonfile):
     for scene in jsonfile["scenes"]:
 
         for section in scene["sections"]:
-            if section["text"][:2] != "<p":  # some text does not have new paragraph tag. Must be added
-                section["text"] = "<p>"+ section["text"] + "</p>"
-            section["text"] = format_kivy(section["text"])
+            section["text"] = format_section_text(section["text"])
 
             for link in section["links"]:
-                link["text"] = re.sub(r'<[^>]*>', '', link["text"])
+                link["text"] = format_link_text(link["text"])
 
     return jsonfile
 
+def format_scene_texts(scene) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    # formats a single Scene record (used when scenes are formatted lazily)
+    return (tuple(format_section_text(section.text) for section in scene.sections),
+            tuple(format_link_text(link.text) for link in scene.sections[-1].links))
+
+def format_section_text(text):
+
+    if text[:2] != "<p":  # some text does not have new paragraph tag. Must be added
+        text = "<p>"+ text + "</p>"
+    return format_kivy(text)
+
+def format_link_text(text):
+    return ANY_TAG.sub('', text)
+
 def get_intro(scenes, id_only = False):
 
     links = get_all_destinations(scenes)
@@ -43,6 +57,68 @@ def get_intro(scenes, id_only = False):
             else:
                 return scene
 
+######################################### RECORDS ################################################
+
+# Read-only records the game reads instead of the dicts of the JSON. Named tuples have no per-instance dict, so a
+# record takes a fraction of the memory of the dict it replaces. Names of variables, locations and soundtracks are
+# interned and values are ints, and identical rules are shared by all the items having them
+
+Rule = tuple[str, int]  # (variable, value)
+NO_RULES: tuple[Rule, ...] = ()  # shared by all items without conditions or consequences
+
+
+class Link(NamedTuple):
+    text: Optional[str]  # None if texts are kept elsewhere (see StoryTexts)
+    destination_scene_id: int
+    conditions: tuple[Rule, ...]
+    consequences: tuple[Rule, ...]
+
+
+class Section(NamedTuple):
+    text: Optional[str]
+    conditions: tuple[Rule, ...]
+    consequences: tuple[Rule, ...]
+    links: tuple[Link, ...]
+
+
+class Scene(NamedTuple):
+    id: int
+    title: Optional[str]
+    location: Optional[str]
+    soundtrack: str
+    sections: tuple[Section, ...]
+
+
+def build_rules(rules, value_key, shared: dict) -> tuple[Rule, ...]:
+    # shared keeps one instance of each rule and of each sequence of rules
+    if not rules:
+        return NO_RULES
+    built = tuple(shared.setdefault((rule["variable"], int(rule[value_key])),
+                                    (intern(rule["variable"]), int(rule[value_key]))) for rule in rules)
+    return shared.setdefault(built, built)
+
+
+def build_scene(scene, shared: dict) -> Scene:
+
+    sections = []
+    for section in scene["sections"]:
+        links = tuple(Link(link["text"], link["destination_scene_id"],
+                           build_rules(link["conditions"], "compare_with_value", shared),
+                           build_rules(link["consequences"], "update_to_value", shared))
+                      for link in section["links"])
+        sections.append(Section(section["text"],
+                                build_rules(section["conditions"], "compare_with_value", shared),
+                                build_rules(section["consequences"], "update_to_value", shared),
+                                links))
+    location = scene["location"]
+    return Scene(scene["id"], scene["title"], intern(location) if location is not None else None,
+                 intern(scene["soundtrack"]), tuple(sections))
+
+
+def build_scenes(scenes) -> list[Scene]:
+    shared: dict = {}
+    return [build_scene(scene, shared) for scene in scenes]
+
 ################################ VARIABLES ###############################
 
 def get_variables(scenes) -> dict[str,int]:
@@ -61,21 +137,28 @@ def get_variables(scenes) -> dict[str,int]:
 
     return variables
 
-def compare_conditions(variables, conditions) -> bool:
-    return all(key not in conditions or conditions[key] == variables[key] for key in variables)
-
-
-def get_conditions(item) -> dict[str,int]:
-    return {condition["variable"]: int(condition["compare_with_value"]) for condition in item["conditions"]}
-
-
-def get_consequences(item) -> dict[str,int]:
-    return {consequence["variable"]: int(consequence["update_to_value"]) for consequence in item["consequences"]}
+def compile_rules(rules: Sequence[Rule], slots: dict[str,int]) -> tuple[tuple[int,int], ...]:
+    # rules of a record (see build_rules). Unknown variables get the next free slot. An item without rules gets the
+    # shared empty tuple
+    return tuple((slots.setdefault(variable, len(slots)), value) for variable, value in rules)
 
 ######################################### TEXT ################################################
 
-def get_sections(scene) -> list[dict]:
-    return list(scene["sections"])
+# Kivy equivalent of each html tag, as (tag prefix, kivy markup, rank). The first matching prefix wins, so order
+# matters (e.g. <br> must be checked before <b>). Rank is used to drop empty [x][/x] pairs (-1 for other tags)
+KIVY_TAGS: tuple[tuple[str, str, int], ...] = (
+    ("<p", "\n", -1), ("</p", "\n", -1),  # new line characters
+    ("<span", "", -1), ("</span", "", -1), ("<div", "", -1), ("</div", "", -1),  # useless tags
+    ("<br", "", -1), ("</br", "", -1),
+    ("<i", "[i]", 0), ("</i", "[/i]", 0), ("<u", "[u]", 1), ("</u", "[/u]", 1),  # useful tags
+    ("<b", "[b]", 2), ("</b", "[/b]", 2))
+
+CENTER_TAG = re.compile(r'<p\s+style="text-align:\s*center;\s*">')
+WHITESPACE_RUN = re.compile(r'\s+')
+ANY_TAG = re.compile(r'<[^>]*>')
+CENTER_MARKUP = re.compile(r'\[\$center\]')
+MARKUP_TAG = re.compile(r'\[(/?)(b|i|u|s|sub|sup|color|size|font|font_context|font_family|font_features|text_language'
+                        r'|ref)(?:=[^\]]*)?\]')
 
 
 def format_kivy(text):  # default 0, buttons do not pass index so /n/n are not removed
@@ -85,41 +168,95 @@ def format_kivy(text):  # default 0, buttons do not pass index so /n/n are not r
         clean_text = get_image(text)  # get_image() will delete any text not part of the tag
         return clean_text
 
-    #TEXT ALIGNMENT
-    # if not first text, no newline character
-    text = re.sub(r'<p\s+style="text-align:\s*center;\s*">', r'[$center]', text, count = 1)
-
-    #NEW LINE CHARACTERS
-    # r is for raw string. Treats \ as regular characters and not as escape characters
-    text = re.sub(r'<p.*?>', r'\n', text)
-    text = re.sub(r'</p.*?>', r'\n', text)
-
-    #REMOVING USELESS TAGS
-    for tag in ['span', 'div', 'br']:  # tags to delete
-        text = re.sub(r'<'+ tag +'.*?>', '', text)
-        text = re.sub(r'</'+ tag +'.*?>', '', text)
-
-    #FORMATTING USEFUL TAGS
-    for tag in ['i', 'u', 'b']:  # tags to kivy format
-        text = re.sub(r'<'+ tag +'.*?>', r'['+ tag +']', text)
-        text = re.sub(r'</'+ tag +'.*?>', r'[/'+ tag +']', text)
-        # this monster removes any tag [x] [/x] with no string in between
-        text = re.sub(r'\[' + tag + r'\]\[/' + tag + r'\]', '', text)
-
-    # FINAL TOUCHES
-    # replaces any occurrence of more than 2 \n in a row by just 2 \n
-    text = re.sub(r'\n\s*\n', r'\n\n', text)
-    # texts must finish only with one \n. Removes extra \n, if any, at the end of text
-    text = re.sub(r'\n\n+$', r'\n', text)
-    # removes one \n in case of interlines between italics verses (typically poems or songs)
-    text = re.sub(r'\[/i\]\n\n\[i\]', r'[/i]\n[i]', text)
-    # removes any \n at the start of text and texts consisting only of \n
-    text = re.sub(r'^\n\s*', '', text)
-      
-    clean_text = re.sub(r'&nbsp;', ' ', text)  # removes residual 'non-breaking space' characters
+    # one scan replacing tags by kivy markups, one scan cleaning up new lines and spaces
+    clean_text = clean_whitespace(transpile_tags(text))
 
     return clean_text
 
+def transpile_tags(text):
+
+    pieces: list[str] = []  # output text
+    ranks: list[int] = []  # for each piece, rank of the kivy opening tag it is or -1
+    gaps: list[int] = []  # for each piece, highest rank of the empty pairs dropped right before it
+    gap: int = -1  # highest rank of the empty pairs dropped after the last piece
+    centered: bool = False  # only the first centered paragraph is marked as [$center]
+    pos: int = 0
+
+    def add(piece, rank=-1):
+        nonlocal gap
+        if piece:
+            pieces.append(piece)
+            ranks.append(rank)
+            gaps.append(gap)
+            gap = -1
+
+    while pos < len(text):
+        start = text.find("<", pos)
+        end = text.find(">", start + 1) if start != -1 else -1
+        if end == -1:  # no more tags
+            add(text[pos:])
+            break
+
+        restart = text.find("<", start + 1, end)
+        if restart != -1:  # the first "<" does not open a tag
+            add(text[pos:restart])
+            pos = restart
+            continue
+
+        add(text[pos:start])
+        tag = text[start:end + 1]
+        pos = end + 1
+
+        if not centered and CENTER_TAG.fullmatch(tag):
+            add("[$center]")
+            centered = True
+            continue
+
+        for prefix, markup, rank in KIVY_TAGS:
+            if tag.startswith(prefix) and "\n" not in tag:
+                break
+        else:  # unknown (or broken over several lines) tags are left as they are
+            add(tag)
+            continue
+
+        if prefix[1] != "/":
+            add(markup, rank)
+        # removes any tag [x] [/x] with no string in between, unless what was in between was an empty pair of same
+        # or higher rank (matches the former tag by tag regex passes, where those were not converted yet)
+        elif rank != -1 and ranks and ranks[-1] == rank and gap < rank:
+            pieces.pop()
+            ranks.pop()
+            gap = max(gaps.pop(), gap, rank)
+        else:
+            add(markup)
+
+    return "".join(pieces)
+
+def clean_whitespace(text):
+
+    pieces: list[str] = []
+    pos: int = 0
+
+    for match in WHITESPACE_RUN.finditer(text):
+        pieces.append(text[pos:match.start()].replace("&nbsp;", " "))  # residual 'non-breaking space' characters
+        pos = match.end()
+        run = match.group()
+        first, last = run.find("\n"), run.rfind("\n")
+
+        if match.start() == 0 and first == 0:  # removes any \n at the start of text and texts consisting only of \n
+            continue
+        if first != last:  # replaces any occurrence of more than 2 \n in a row by just 2 \n
+            run = run[:first] + "\n\n" + run[last + 1:]
+            if pos == len(text) and run.endswith("\n\n"):  # texts must finish only with one \n
+                run = run[:-1]
+            # removes one \n in case of interlines between italics verses (typically poems or songs)
+            elif run == "\n\n" and text.startswith("[i]", pos) and pieces[-1].endswith("[/i]"):
+                run = "\n"
+        pieces.append(run)
+
+    pieces.append(text[pos:].replace("&nbsp;", " "))
+    return "".join(pieces)
+
 def get_image(text):
 
     pattern = r'/([^/]+\.(?:png|jpeg|jpg))'  # images as .png or .jpeg are supported
@@ -129,21 +266,52 @@ def get_image(text):
         image_name = match.group(1)
         return "[$image]" + image_name
 
+def get_image_names(scenes) -> list[str]:  # works for both formatted and raw scenes
+    names = {}
+    for scene in scenes:
+        for section in scene["sections"]:
+            text = section["text"]
+            if text.find("<img src=") != -1:
+                text = get_image(text) or ""
+            if text[:8] == "[$image]":
+                names[text[8:]] = None  # keeps order of appearance, without duplicates
+    return list(names)
+
 def align(text):
     
     if text [:9] == "[$center]":
         alignment = "center"
     else:
         alignment = "left"
-    text = re.sub(r'\[\$center\]', '', text)  # removes any [$center] tag that accidentally is the text
+    text = CENTER_MARKUP.sub('', text)  # removes any [$center] tag that accidentally is the text
     return [text, alignment]
 
+def split_paragraphs(text) -> list[str]:
+    # splits a formatted text at the blank lines (\n\n) left by format_kivy. Every paragraph but the last keeps one
+    # \n, so the heights of the paragraphs add up to the height of the whole text. Markup tags open at a split are
+    # closed at the end of the paragraph and opened again in the next one, so each paragraph renders on its own
+    paragraphs = text.split("\n\n")
+    open_tags = []  # (name, tag) of the tags open at the end of the previous paragraph
+    chunks = []
+    for index, paragraph in enumerate(paragraphs):
+        chunk = "".join(tag for name, tag in open_tags) + paragraph
+        for match in MARKUP_TAG.finditer(paragraph):
+            if match.group(1):  # closing tag, closes the last tag of the same name
+                for position in range(len(open_tags) - 1, -1, -1):
+                    if open_tags[position][0] == match.group(2):
+                        del open_tags[position]
+                        break
+            else:
+                open_tags.append((match.group(2), match.group(0)))
+        chunk += "".join(f"[/{name}]" for name, tag in reversed(open_tags))
+        if index < len(paragraphs) - 1:
+            chunk += "\n"
+        if paragraph or index < len(paragraphs) - 1:  # a trailing \n\n adds no height
+            chunks.append(chunk)
+    return chunks
+
 ###################################################### LINKS #########################################
 
 def get_all_destinations(scenes) -> set[int]:
     return {link["destination_scene_id"] for scene in scenes
             for section in scene["sections"] for link in section["links"]}
-
-
-def get_links(section) -> list[dict]:
-    return list(section["links"])
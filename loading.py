@@ -0,0 +1,136 @@
+##################################################################################################################
+##                                    LOADING PIPELINE                                                          ##
+##################################################################################################################
+
+# Setting up a game (parsing and formatting the story, decoding the opening soundtrack, decoding the pictures) used
+# to run on the main thread, so LoadingScreen was often never drawn. LoadingPipeline runs those steps as tasks of a
+# thread pool instead. The result of each task is handed over to the main thread through the Kivy Clock, where it is
+# registered (e.g. textures uploaded) by the callback of the task. Progress is the weight of the tasks done over the
+# weight of all tasks, reported on the main thread as well, so LoadingScreen shows it while frames keep being drawn.
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from threading import Event
+from typing import Any, Callable, Optional
+
+from kivy.clock import Clock
+
+import tracing
+
+WORKERS: int = 3  # tasks are mostly I/O and decoding, so they overlap well even with the GIL
+
+
+class LoadingTask:
+    """
+    Step of a load: work done by the thread pool and callback registering its result on the main thread
+    """
+    def __init__(self, name: str, work: Callable[[], Any], weight: float,
+                 on_done: Optional[Callable[[Any], None]]):
+        self.name: str = name
+        self.work: Callable[[], Any] = work  # must not touch widgets nor create textures
+        self.weight: float = weight  # relative cost of the task, used for the progress
+        self.on_done: Optional[Callable[[Any], None]] = on_done
+
+
+class LoadingPipeline:
+    """
+    Runs loading tasks in a thread pool and reports their results, progress and completion on the main thread.
+    Tasks are added before start(). A task whose work raises an exception raises it again on the main thread
+    """
+    def __init__(self, on_progress: Callable[[float], None], on_complete: Callable[[], None],
+                 workers: int = WORKERS):
+        self.on_progress: Callable[[float], None] = on_progress  # called with the progress, from 0 to 1
+        self.on_complete: Callable[[], None] = on_complete
+        self.workers: int = workers
+        self.tasks: list[LoadingTask] = []
+        self.done: float = 0.0  # weight of the tasks done
+        self.cancelled: bool = False
+        self._pending: int = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # tasks wait until all threads are started: a thread starting while another one runs a long call holding the
+        # GIL (e.g. decoding) would block the main thread until that call returns
+        self._submitted: Event = Event()
+
+    @property
+    def progress(self) -> float:
+        total: float = sum(task.weight for task in self.tasks)
+        return self.done / total if total else 1.0
+
+    def add(self, name: str, work: Callable[[], Any], weight: float = 1.0,
+            on_done: Optional[Callable[[Any], None]] = None) -> None:
+        """
+        Adds a task to the pipeline
+        :param name: name of the task, as traced
+        :param work: function run by the thread pool
+        :param weight: relative cost of the task
+        :param on_done: function called on the main thread with the result of work, if any
+        :return: None
+        """
+        self.tasks.append(LoadingTask(name, work, weight, on_done))
+
+    def start(self) -> None:
+        """
+        Submits all tasks to the thread pool. on_complete is called once all of them are done
+        :return: None
+        """
+        self._pending = len(self.tasks)
+        self.on_progress(0.0)
+        if not self.tasks:
+            Clock.schedule_once(lambda dt: self._complete())
+            return
+        self._executor = ThreadPoolExecutor(max_workers=min(self.workers, len(self.tasks)),
+                                            thread_name_prefix="loading")
+        for task in self.tasks:
+            future: Future = self._executor.submit(self._run, task)
+            future.add_done_callback(partial(self._schedule_done, task))
+        self._submitted.set()
+        self._executor.shutdown(wait=False)  # threads exit once the tasks are done
+
+    def cancel(self) -> None:
+        """
+        Ignores the tasks still running, e.g. when another load starts. Their results are dropped
+        :return: None
+        """
+        self.cancelled = True
+        self._submitted.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, task: LoadingTask) -> Any:
+        self._submitted.wait()
+        if self.cancelled:
+            return None
+        with tracing.span(f"loading {task.name}"):
+            return task.work()
+
+    def _schedule_done(self, task: LoadingTask, future: Future) -> None:
+        """
+        Hands over a finished task to the main thread. Called from the thread that ran it
+        :param task: task finished
+        :param future: future of the task
+        :return: None
+        """
+        Clock.schedule_once(partial(self._on_task_done, task, future))
+
+    def _on_task_done(self, task: LoadingTask, future: Future, dt) -> None:
+        """
+        Registers the result of a task, updates the progress and completes the load after the last task
+        :param task: task finished
+        :param future: future of the task
+        :param dt: delta time
+        :return: None
+        """
+        if self.cancelled or future.cancelled():
+            return
+        result: Any = future.result()  # raises the exception of the task, if any
+        if task.on_done is not None:
+            task.on_done(result)
+        self.done += task.weight
+        self._pending -= 1
+        self.on_progress(self.progress)
+        if self._pending == 0:
+            self._complete()
+
+    def _complete(self) -> None:
+        if not self.cancelled:
+            self.on_complete()
@@ -1,18 +1,40 @@
-from os import path, remove
+from __future__ import annotations  # annotations may name modules imported lazily (see FogApp.setup_game)
+
+from time import perf_counter
+STARTUP_TIME: float = perf_counter()  # before Kivy is imported, origin of the startup breakdown
+
+from array import array
+from functools import partial
+from os import path
 import sys
-from typing import Optional, LiteralString, Type
-from json import dump, load
+from typing import TYPE_CHECKING, NamedTuple, Optional, LiteralString, Type
 
 from kivy.app import App
-from kivy.clock import Clock
+from kivy.clock import Clock, ClockEvent
 from kivy.core.text import LabelBase
-from kivy.properties import StringProperty
-from kivy.uix.screenmanager import ScreenManager, FadeTransition, Screen
-from kivy.core.audio import SoundLoader, Sound
+from kivy.logger import Logger
+from kivy.metrics import Metrics
+from kivy.properties import BooleanProperty, StringProperty
+from kivy.uix.screenmanager import ScreenManager, Screen, TransitionBase
 
 import json_utils
+import tracing
 import widgets as wdg
-from audio_names_volumes import get_volume, get_audio_names
+from save_manager import History, SaveManager
+from text_cache import TextTextureCache
+from transitions import TransitionTuner
+
+if TYPE_CHECKING:  # not needed by the first screen, imported by FogApp.setup_game()
+    from kivy.core.window import WindowBase
+    from audio_manager import AudioManager
+    from game_state import GameState, Rules
+    from image_cache import ImageCache
+    from loading import LoadingPipeline
+    from story_engine import ResolvedScene, StoryEngine
+    from story_graph import StoryGraph
+    from story_model import StoryModel, StoryTexts
+
+IMPORTS_TIME: float = perf_counter()
 
 
 def get_resource_path(relative_path: str) -> LiteralString | str | bytes:
@@ -27,80 +49,204 @@ def get_resource_path(relative_path: str) -> LiteralString | str | bytes:
         base_path = path.abspath(".")
     return path.join(base_path, relative_path)
 
-LabelBase.register(name = "Vollkorn",
-                   fn_regular= get_resource_path("fonts/Vollkorn-Regular.ttf"),
-                   fn_italic=get_resource_path("fonts/Vollkorn-Italic.ttf"))
-LabelBase.register(name = "CreteRound",
-                   fn_regular= get_resource_path("fonts/CreteRound-Regular.ttf"))
-LabelBase.register(name = "Chiller",
-                   fn_regular= get_resource_path("fonts/Chiller.ttf"))
+FONTS: dict[str, dict[str, str]] = {"Vollkorn": {"fn_regular": "fonts/Vollkorn-Regular.ttf",
+                                                  "fn_italic": "fonts/Vollkorn-Italic.ttf"},
+                                     "CreteRound": {"fn_regular": "fonts/CreteRound-Regular.ttf"},
+                                     "Chiller": {"fn_regular": "fonts/Chiller.ttf"}}
+FIRST_SCREEN_FONTS: tuple[str, ...] = ("Vollkorn", "CreteRound")  # fonts of LanguageMenu, the others are deferred
+registered_fonts: set[str] = set()
+STORY_PATHS: tuple[str, ...] = ("languages/Fog.json", "languages/Niebla.json")  # one per language, see LanguageMenu
+PICTURES_MARGIN: float = 50.0  # horizontal padding around the pictures (GameTextImageLayout in fog.kv), in dp
+
+def register_fonts(names: tuple[str, ...]) -> None:
+    """
+    Registers font families (see FONTS) not registered yet
+    :param names: names of the font families
+    :return: None
+    """
+    for name in names:
+        if name not in registered_fonts:
+            LabelBase.register(name=name, **{style: get_resource_path(fn) for style, fn in FONTS[name].items()})
+            registered_fonts.add(name)
+
+
+class PreparedScreen(NamedTuple):
+    """
+    GameScreen assembled in advance for the destination of a GameButton (see FogApp.prepare_next_gamescreens())
+    """
+    start_values: array  # variables predicted when the GameButton is released
+    variables: GameState  # variables once the screen is assembled (section consequences applied)
+    screen: wdg.GameScreen
 
 class FogApp(App):
     """
     Class defining the game
     """
     next_soundtrack = StringProperty(None, allownone=True)
+    can_undo = BooleanProperty(False)  # if True, the last choice can be undone (enables UndoButton)
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.game_filename: Optional[str] = None
         self.root_layout: Optional[wdg.RootLayout] = None
         self.language: Optional[str] = None
-        self.story: Optional[dict] = None
+        self.story_model: Optional[StoryModel] = None  # stories of all languages, see FogApp.preload_stories()
+        self.story_texts: Optional[StoryTexts] = None  # texts of the selected language
         self.title: Optional[str] = None
-        self.scenes: Optional[list[dict]] = None
-        self.variables: Optional[dict[str,int]] = None
-        self.scene: Optional[dict] = None
-        self.soundtracks: Optional[dict[str,Sound]] = None
+        self.graph: Optional[StoryGraph] = None
+        self.engine: Optional[StoryEngine] = None  # current scene and variables, see FogApp.scene and variables
+        self.audio: Optional[AudioManager] = None
+        self.images: Optional[ImageCache] = None
+        self.loading: Optional[LoadingPipeline] = None  # load in progress, see FogApp.setup_game()
+        self.saves: SaveManager = SaveManager("saved_game.journal", legacy_filename="saved_game.json")
         self.soundtrack: Optional[str] = None  # soundtrack name currently playing
         # event is triggered by calling wrapper methods, never directly
         self.bind(next_soundtrack=self._on_next_soundtrack)
 
         self.sm: Optional[ScreenManager] = None
         self.interface: Optional[wdg.InterfaceLayout] = None
-        self.start_game_transition_time: float = 1.4  # transition duration to the first screen of the game
-        self.in_game_transition_time: float = 0.4  # transition duration between screens during game
+        self.screen_pool: Optional[wdg.GameScreenPool] = None
+        self.text_textures: TextTextureCache = TextTextureCache()  # textures of the texts of GameScreens
+        self.start_game_transition_time: float = 1.4  # target transition duration to the first screen of the game
+        self.in_game_transition_time: float = 0.4  # target transition duration between screens during game
+        self.content_transition: bool = True  # if True, only the content of the incoming screen fades in
+        self.adaptive_transitions: bool = True  # if True, transitions are shortened or simplified if frames are missed
+        self.transitions: Optional[TransitionTuner] = None
+        self.lazy_formatting: bool = True  # if True, scenes are formatted when first shown instead of at setup
+        self.max_formatted_scenes: int = 32  # formatted scenes kept in memory when formatting lazily
+        self.launch_delay: Optional[float] = None  # if None, app launches once the first frame is drawn
+        self.startup_times: list[tuple[str, float]] = [("imports", IMPORTS_TIME)]
+        self.virtual_text: bool = True  # if True, texts are split in paragraphs only rendered near the viewport
+        self.prebuild_gamescreens: bool = True  # if True, next GameScreens are assembled in advance while idle
+        self.prepared: dict[wdg.GameButton, PreparedScreen] = {}
+        self._prepare_queue: list[wdg.GameButton] = []  # GameButtons whose destination is still to be assembled
+        self._prepare_event: Optional[ClockEvent] = None
 
 
     def build(self) -> ScreenManager:
-        self.soundtracks = {key: None for key in get_audio_names()}
+        register_fonts(FIRST_SCREEN_FONTS)
         self.root_layout = wdg.RootLayout()
         self.interface = wdg.InterfaceLayout()
-        self.sm = ScreenManager(transition=FadeTransition())
+        self.screen_pool = wdg.GameScreenPool()
+        wdg.CachedTextMixin.cache = self.text_textures
+        self.sm = ScreenManager()
+        self.transitions = TransitionTuner(self.sm, "content" if self.content_transition else "fade",
+                                           adaptive=self.adaptive_transitions,
+                                           on_complete=self.prepare_next_gamescreens,
+                                           is_busy=lambda: self._prepare_event is not None)
         self.root_layout.add_widget(self.sm)
+        self.startup_times.append(("build", perf_counter()))
         return self.root_layout
 
+    @property
+    def scene(self) -> Optional[json_utils.Scene]:
+        """
+        Gets the current scene, kept by FogApp.engine
+        :return: the current scene
+        """
+        return self.engine.scene if self.engine is not None else None
+
+    @property
+    def variables(self) -> Optional[GameState]:
+        """
+        Gets the game variables, kept by FogApp.engine
+        :return: the game variables
+        """
+        return self.engine.variables if self.engine is not None else None
+
     def get_scene_soundtrack(self) -> str:
         """
         Gets the name of the soundtrack of the current scene
         :return: the name of the soundtrack
         """
-        return self.scene["soundtrack"]
+        return self.scene.soundtrack
 
-    def get_scene(self, scene_id:int) -> dict:
+    @tracing.traced()
+    def get_scene(self, scene_id:int) -> json_utils.Scene:
         """
-        Gets the scene with the passed id from App.scenes
+        Gets the scene with the passed id from App.graph
         :param scene_id: id of the scene to get
         :return: scene
         """
-        for scene in self.scenes:
-            if scene["id"] == scene_id:
-                return scene
+        return self.graph.get_scene(scene_id)
 
     def get_scene_location(self) -> str:
         """
         Gets the location of the current scene
         :return: the location of the current scene
         """
-        return self.scene["location"]
+        return self.graph.get_location(self.scene.id)
 
     def on_start(self) -> None:
         """
-        Schedules app launch some time ahead to avoid black screen issue during app launching on Android.
+        Schedules app launch once the first frame is drawn (or after FogApp.launch_delay) to avoid black screen
+        issue during app launching on Android.
         See the following GitHub issue for more info: https://github.com/kivy/python-for-android/issues/2720
         :return: None
         """
-        Clock.schedule_once(self._launch_app, 2)
+        tracing.start_frame_tracing()  # only if FOG_TRACE is set
+        self.root_window.bind(size=self.text_textures.clear)  # cached texts were rendered for the former width
+        if self.launch_delay is not None:
+            Clock.schedule_once(self._launch_app, self.launch_delay)
+        else:
+            self.root_window.bind(on_flip=self._on_first_frame)
+
+    def _on_first_frame(self, window: WindowBase) -> None:
+        """
+        Launches the app on the frame following the first one drawn
+        :param window: the app window
+        :return: None
+        """
+        window.unbind(on_flip=self._on_first_frame)
+        self.startup_times.append(("first frame", perf_counter()))
+        Clock.schedule_once(self._launch_app, 0)
+
+    def _on_first_interactive_frame(self, window: WindowBase) -> None:
+        """
+        Logs the startup breakdown once the first frame showing LanguageMenu is drawn
+        :param window: the app window
+        :return: None
+        """
+        window.unbind(on_flip=self._on_first_interactive_frame)
+        self.startup_times.append(("language menu", perf_counter()))
+        previous: float = STARTUP_TIME
+        steps: list[str] = []
+        for step, time in self.startup_times:
+            steps.append(f"{step} {(time - previous) * 1000:.0f} ms")
+            previous = time
+        Logger.info(f"Startup: {', '.join(steps)}, total {(previous - STARTUP_TIME) * 1000:.0f} ms "
+                    f"since main.py started")
+        self.preload_stories()
+
+    def preload_stories(self) -> None:
+        """
+        Starts loading the stories of all languages in the background while LanguageMenu is shown, so setting up the
+        game does not wait for them (see StoryModel)
+        :return: None
+        """
+        if self.story_model is None:
+            from story_model import StoryModel  # not needed by LanguageMenu itself
+            self.story_model = StoryModel({rel_path: get_resource_path(rel_path) for rel_path in STORY_PATHS},
+                                          formatted=not self.lazy_formatting,
+                                          max_formatted_scenes=self.max_formatted_scenes)
+        self.story_model.preload()
+
+    def on_pause(self) -> bool:
+        """
+        Makes sure the game is saved before the app goes to background (it may be killed there)
+        :return: True, so the app is paused instead of stopped
+        """
+        self.saves.flush()
+        tracing.dump()
+        return True
+
+    def on_stop(self) -> None:
+        """
+        Makes sure the game is saved before the app closes (and writes the trace, if tracing)
+        :return: None
+        """
+        self.saves.flush()
+        tracing.dump()
 
     def _launch_app(self, dt) -> None:
         """
@@ -110,32 +256,26 @@ class FogApp(App):
         """
         self.sm.add_widget(wdg.LanguageMenu(name="current_screen"))
         self.sm.current = "current_screen"
-
-    def _load_soundtracks(self) -> None:
-        """
-        Loads all soundtracks at once so app is not slowed down at runtime. Soundtracks are in soundtracks/ folder
-        :return: None
-        """
-        for key in self.soundtracks.keys():
-            self.soundtracks[key] = SoundLoader.load(f"soundtracks/{key}")
-            self.soundtracks[key].volume = get_volume(key)
+        self.root_window.bind(on_flip=self._on_first_interactive_frame)
 
     def _on_next_soundtrack(self, fog_app:App, next_soundtrack_name:Optional[str]) -> None:
         """
-        Stops previous soundtrack (if any) and plays next one
+        Crossfades from previous soundtrack (if any) to next one. Never blocks: loading and fading are handled by
+        FogApp.audio in the background
         :param fog_app: instance of the app
         :param next_soundtrack_name: soundtrack to be played
         :return: None
         """
-        if self.soundtrack is not None:  # if a soundtrack is currently playing
-            self.soundtracks[self.soundtrack].stop()
+        if self.next_soundtrack is None:
+            self.audio.stop(fade=self.in_game_transition_time)
             self.soundtrack = None
-        if self.next_soundtrack is not None:
+        else:
             nst_name = next_soundtrack_name.removesuffix("--in-loop")
-            self.soundtracks[nst_name].loop = True if next_soundtrack_name.endswith("--in-loop") else False
+            self.audio.play(nst_name, loop=next_soundtrack_name.endswith("--in-loop"),
+                            fade=self.in_game_transition_time)
             self.soundtrack = nst_name
-            self.soundtracks[nst_name].play()
 
+    @tracing.traced()
     def update_soundtrack(self, next_soundtrack: Optional[str], loop:bool) -> None:
         """
         Updates the soundtrack, pass None to stop it or the name of a soundtrack file to play it.
@@ -153,87 +293,157 @@ class FogApp(App):
         Checks if there is a saved game
         :return: True if saved game, else False
         """
-        return path.exists("saved_game.json")
+        return self.saves.exists
 
     def reset_variables(self) -> None:
         """
         Resets all variables of the game
         :return: None
         """
-        self.variables = {key: 0 for key in self.variables}
+        self.engine.reset()
 
-    def save_game(self) -> None:
+    @tracing.traced()
+    def save_game(self, button: wdg.GameButton) -> None:
         """
-        Gets the game state and saves the game
+        Saves the choice of a GameButton (see SaveManager). Returns immediately, the saved_game.journal file is
+        written in the background by FogApp.saves
+        :param button: GameButton just activated
         :return: None
         """
-        game_state: dict = {"variables": self.variables,
-                            "current_scene_id": self.scene["id"]}
-        with open("saved_game.json", "w") as f:
-            dump(game_state, f, indent=4)
+        self.saves.save(self.engine.get_choice(button.destination_scene_id, button.consequences),
+                        self.engine.get_state)
+        self.can_undo = self.saves.can_undo
 
-    @staticmethod
-    def delete_saved_game() -> None:
+    def delete_saved_game(self) -> None:
         """
-        Deletes the saved_game.json file
+        Deletes the saved_game.journal file
         :return: None
         """
-        if path.exists("saved_game.json"):
-            remove("saved_game.json")
+        self.saves.delete()
+        self.can_undo = False
 
+    @tracing.traced()
     def setup_game(self, rel_path: str) -> None:
         """
-        Sets up App (game) attributes
+        Sets up App (game) attributes. The story, the opening soundtrack and the pictures are loaded by
+        FogApp.loading in a thread pool while LoadingScreen shows the progress, StartMenu is shown once all are loaded
         :param rel_path: relative path to the JSON containing the game
         :return: None
         """
         self.show_screen(wdg.LoadingScreen)
-        self.story = json_utils.read_json(get_resource_path(rel_path))
-        self.title = self.story["title"]
-        self.scenes = json_utils.get_scenes(self.story,
-                                            formatted=True)  # removes html tags and introduces kivy markups
-        self.variables = json_utils.get_variables(self.scenes)
-        Clock.schedule_once(self._finish_setup, 0)  # scheduled to the next frame
+        # modules and fonts not needed by LanguageMenu are only loaded now, so they do not delay the app launch
+        register_fonts(tuple(FONTS))
+        from audio_manager import AudioManager
+        from image_cache import ATLAS_PATH, ImageCache
+        from loading import LoadingPipeline
+        if self.audio is None:
+            self.audio = AudioManager(get_resource_path("soundtracks"))
+            self.images = ImageCache(get_resource_path("pics"), get_resource_path(ATLAS_PATH))
+
+        # unless formatting lazily, texts come already formatted (html tags removed, kivy markups introduced)
+        # from the compiled story cache. Usually preloaded while LanguageMenu was shown, then load() only waits
+        self.preload_stories()
+        if self.loading is not None:
+            self.loading.cancel()
+        self.loading = LoadingPipeline(self._on_loading_progress, self._finish_setup)
+        self.loading.add("story", partial(self.story_model.load, rel_path), weight=3,
+                         on_done=lambda story_texts: self._set_story(rel_path))
+        self.loading.add("opening soundtrack", partial(self.audio.load, "opening.mp3"), weight=2,
+                         on_done=lambda sound: self.audio.put("opening.mp3", sound, pinned=True))
+        width: float = self.get_pictures_width()  # pictures are decoded at the variants shown at this width
+        self.loading.add("pictures",  # before any picture is shown
+                         lambda: self.images.decode(self.story_model.load(rel_path).images, width), weight=2,
+                         on_done=self.images.register)
+        self.loading.start()
+
+    def _on_loading_progress(self, progress: float) -> None:
+        """
+        Shows the progress of FogApp.loading on LoadingScreen
+        :param progress: progress of the load, from 0 to 1
+        :return: None
+        """
+        screen: Screen = self.sm.get_screen("current_screen")
+        if isinstance(screen, wdg.LoadingScreen):
+            screen.progress = progress
 
-    def _finish_setup(self, dt) -> None:
+    def _set_story(self, rel_path: str) -> None:
         """
-        This part of the setup is scheduled to the next frame so LoadingScreen can be shown before calling
-        FogApp._load_soundtracks() (very heavy process that blocks the app).
-        :param dt: delta time
+        Sets the story loaded by FogApp.loading
+        :param rel_path: relative path to the JSON containing the game
         :return: None
         """
-        self._load_soundtracks()
+        from story_engine import StoryEngine
+        self.graph, self.story_texts = self.story_model.get(rel_path)
+        self.title = self.story_texts.title
+        self.engine = StoryEngine(self.graph)
+
+    @tracing.traced()
+    def _finish_setup(self) -> None:
+        """
+        Starts the opening soundtrack and shows StartMenu once FogApp.loading is done. Soundtracks of the first
+        scenes of the game are prefetched in the background
+        :return: None
+        """
+        self.loading = None
+        self.audio.graph = self.graph
+        self.audio.prefetch(self.graph.intro_id)
         self.update_soundtrack("opening.mp3", loop=False)
         self.show_screen(wdg.StartMenu)
 
+    @tracing.traced()
     def start_game(self) -> None:
         """
         Sets up App attributes and generates the first screen of the game
         :return: None
         """
-        self.scene = json_utils.get_intro(self.scenes)
+        self.engine.start()
+        self.saves.begin(self.engine.get_state())
+        self.can_undo = False
         self._launch_game()
 
+    @tracing.traced()
     def load_game(self) -> None:
         """
-        Overwrites the game state according to the saved_game.json file and generates the first screen of loaded game
+        Overwrites the game state according to the saved_game.journal file and generates the first screen of loaded game
         :return: None
         """
-        with open("saved_game.json","r") as f:
-            game_state: dict = load(f)
-
-        self.variables = game_state["variables"]
-        self.scene = self.get_scene(game_state["current_scene_id"])
+        history: Optional[History] = self.saves.load()  # includes choices not written to the disk yet
+        if history is None:  # e.g. journal damaged since StartMenu was shown
+            self.start_game()
+            return
+        self.engine.load(*history)
+        self.can_undo = self.saves.can_undo
         self._launch_game()
 
+    def undo_choice(self) -> None:
+        """
+        Goes back to the scene before the last choice, with the variables as they were then (see UndoButton)
+        :return: None
+        """
+        if not isinstance(self.sm.current_screen, wdg.GameScreen):
+            return
+        history: Optional[History] = self.saves.undo()
+        self.can_undo = self.saves.can_undo
+        if history is None:
+            return
+        self.discard_prepared_gamescreens()
+        self.engine.load(*history)
+        self.audio.prefetch(self.scene.id)
+        if self.soundtrack is not None:
+            self.update_soundtrack(self.get_scene_soundtrack(), loop=True)
+        self.interface.update_locationlabel(self.get_scene_location())
+        self.show_gamescreen(self.in_game_transition_time)
+
     def _launch_game(self) -> None:
         """
         Launches the game and shows the first screen
         :return: None
         """
+        self.audio.prefetch(self.scene.id)
         self.update_soundtrack(self.get_scene_soundtrack(), loop=True)
         self.interface.update_locationlabel(self.get_scene_location())
         self.show_interface_bar()
+        self.transitions.ignore_next()  # fonts, textures and soundtracks are still loading while it fades in
         self.show_gamescreen(self.start_game_transition_time, adapt_height=True)
 
     def show_interface_bar(self) -> None:
@@ -258,87 +468,178 @@ class FogApp(App):
         Replaces the current screen with a new one without transitions.
         :param screen_cls: Screen class to instantiate (e.g. StartMenu)
         """
-        self.sm.remove_widget(self.sm.get_screen("current_screen"))
+        self._remove_screen(self.sm.get_screen("current_screen"))
         self.sm.add_widget(screen_cls(name="current_screen"))
 
-    def show_gamescreen(self, transition_duration: float, adapt_height: bool = False) -> None:
+    def _remove_screen(self, screen: Screen) -> None:
+        """
+        Removes a screen from the ScreenManager. GameScreens are released to FogApp.screen_pool to be reused
+        :param screen: screen to remove
+        :return: None
         """
-        Assembles the next game screen and displays it
-        :param transition_duration: duration in seconds of the transition
+        self.sm.remove_widget(screen)
+        if isinstance(screen, wdg.GameScreen):
+            self.screen_pool.release_screen(screen)
+
+    @tracing.traced()
+    def show_gamescreen(self, transition_duration: float, adapt_height: bool = False,
+                        prepared: Optional[PreparedScreen] = None) -> None:
+        """
+        Displays the next game screen. A screen assembled in advance is used if the variables it was assembled for
+        are the current ones, otherwise the screen is assembled now
+        :param transition_duration: target duration in seconds of the transition
         :param adapt_height: if True, height is scaled according to GameScreen.height_mod before fading in
+        :param prepared: screen assembled in advance for the current scene, if any
         :return: None
         """
-        next_screen = wdg.GameScreen(name="next_screen", adapt_height=adapt_height)
-        self.place_text_and_images(next_screen)
-        self.place_gamebuttons(next_screen)
+        if self.sm.transition.is_active:  # the screen fading out is about to be reused
+            self.sm.transition.stop()
+
+        if prepared is not None and prepared.start_values == self.variables.values:
+            next_screen: wdg.GameScreen = prepared.screen
+            self.engine.variables = prepared.variables
+        else:
+            if prepared is not None:  # prediction missed
+                self.screen_pool.release_screen(prepared.screen)
+            next_screen: wdg.GameScreen = self.assemble_gamescreen(self.scene, self.variables, adapt_height)
+        next_screen.name = "next_screen"
         self._transition_screen(next_screen, transition_duration)
 
+    @tracing.traced()
+    def assemble_gamescreen(self, scene: json_utils.Scene, variables: GameState, adapt_height: bool) -> wdg.GameScreen:
+        """
+        Assembles the GameScreen of a scene. Section consequences are applied to the passed variables
+        :param scene: scene to display
+        :param variables: game variables when the scene is displayed
+        :param adapt_height: if True, height is scaled according to GameScreen.height_mod before fading in
+        :return: the GameScreen
+        """
+        screen: wdg.GameScreen = self.screen_pool.get_screen(name="next_screen", adapt_height=adapt_height)
+        resolved_scene: ResolvedScene = self.engine.resolve(scene, variables)
+        self.place_text_and_images(screen, resolved_scene)
+        self.place_gamebuttons(screen, resolved_scene)
+        return screen
+
+    def prepare_next_gamescreens(self, transition: TransitionBase) -> None:
+        """
+        Starts assembling in advance, one per frame, the GameScreens the GameButtons of the current screen lead to.
+        Called once the transition to a GameScreen is complete, so it does not compete with the fading for frames
+        :param transition: transition completed
+        :return: None
+        """
+        current_screen: Screen = self.sm.current_screen
+        if not self.prebuild_gamescreens or not isinstance(current_screen, wdg.GameScreen) or self.prepared:
+            return
+        # stop() completes the transition too, while still active: the screen it led to is about to be left
+        if transition.is_active or transition.screen_in is not current_screen:
+            return
+        self._prepare_queue = [widget for widget in current_screen.button_layout.children
+                               if isinstance(widget, wdg.GameButton)]
+        if self._prepare_queue and self._prepare_event is None:
+            self._prepare_event = Clock.schedule_once(self._prepare_next_gamescreen, 0)
+
+    @tracing.traced()
+    def _prepare_next_gamescreen(self, dt) -> None:
+        """
+        Assembles the GameScreen of the next queued GameButton, predicting the variables from its consequences,
+        and schedules the following one to the next frame
+        :param dt: delta time
+        :return: None
+        """
+        self._prepare_event = None
+        if not self._prepare_queue:
+            return
+        button: wdg.GameButton = self._prepare_queue.pop()
+        variables: GameState = self.engine.predict(button.consequences)
+        start_values: array = array("i", variables.values)
+        screen: wdg.GameScreen = self.assemble_gamescreen(self.get_scene(button.destination_scene_id), variables,
+                                                          adapt_height=False)
+        self.prepared[button] = PreparedScreen(start_values, variables, screen)
+        if self._prepare_queue:
+            self._prepare_event = Clock.schedule_once(self._prepare_next_gamescreen, 0)
+
+    def discard_prepared_gamescreens(self, keep: Optional[wdg.GameButton] = None) -> Optional[PreparedScreen]:
+        """
+        Stops assembling GameScreens in advance and releases the ones assembled
+        :param keep: GameButton whose prepared screen must not be released
+        :return: the prepared screen of keep, if any
+        """
+        if self._prepare_event is not None:
+            self._prepare_event.cancel()
+            self._prepare_event = None
+        self._prepare_queue.clear()
+        kept: Optional[PreparedScreen] = self.prepared.pop(keep, None)
+        for prepared in self.prepared.values():
+            self.screen_pool.release_screen(prepared.screen)
+        self.prepared.clear()
+        return kept
+
+    @tracing.traced()
     def _transition_screen(self, next_screen: wdg.Screen, duration: float) -> None:
         """
         Transitions softly from the current screen to the next screen
         :param next_screen: next screen to be displayed
-        :param duration: duration in seconds of the transition
+        :param duration: target duration in seconds of the transition, see TransitionTuner
         :return: None
         """
-        self.sm.transition.duration = duration
+        self.sm.transition.duration = self.transitions.get_duration(duration)
         self.sm.add_widget(next_screen)
-        # self.sm.get_screen("current_screen").opacity = 0  # uncomment this to supress fading out of current_screen
         self.sm.current = "next_screen"
-        self.sm.remove_widget(self.sm.get_screen("current_screen"))
+        self._remove_screen(self.sm.get_screen("current_screen"))
         self.sm.get_screen("next_screen").name = "current_screen"
 
-    def place_text_and_images(self, screen: wdg.Screen) -> None:
+    @tracing.traced()
+    def place_text_and_images(self, screen: wdg.GameScreen, resolved_scene: ResolvedScene) -> None:
         """
-        Wrapper to generate GameTextLabel and GameImage and organize them in their GameTextImageLayout
+        Wrapper to generate GameTextLabel (or GameTextChunks, see FogApp.virtual_text) and GameImage and organize them
+        in their GameTextImageLayout
         :param screen: Screen in which the text and images must be placed
+        :param resolved_scene: sections and links to display, see StoryEngine.resolve()
         :return: None
         """
-        layout = wdg.GameTextImageLayout()
-        sections: list[dict] = json_utils.get_sections(self.scene)
+        layout: wdg.GameTextImageLayout = screen.text_image_layout
+
+        for text in resolved_scene.texts:
 
-        for section in sections:
-            conditions: dict = json_utils.get_conditions(section)
+            if text[:8] == "[$image]":  # if image
+                game_resource: wdg.ImageLayout = self._assemble_gameimage(img_name=text[8:])
 
-            if json_utils.compare_conditions(self.variables, conditions):
+            elif self.virtual_text:  # if text, one GameTextChunk per paragraph
+                text, halign = json_utils.align(text)
+                for paragraph in json_utils.split_paragraphs(text):
+                    layout.add_widget(self.screen_pool.get_chunk(text=paragraph, halign=halign))
+                continue
 
-                if section["text"][:8] == "[$image]":  # if image
-                    game_resource: wdg.ImageLayout = self._assemble_gameimage(img_path="pics/" + section["text"][8:])
+            else:  # if text
+                game_resource: wdg.GameTextLabel = self._assemble_gametext(json_utils.align(text))
 
-                else:  # if text
-                    game_resource: wdg.GameTextLabel = self._assemble_gametext(json_utils.align(section["text"]))
-                
-                consequences: dict = json_utils.get_consequences(section)  # consequences checked for both texts and images
-                self.variables.update(consequences)
-                layout.add_widget(game_resource)
+            layout.add_widget(game_resource)
 
-        screen.layout.add_widget(layout)
+        if self.virtual_text:
+            screen.update_visible_chunks()
 
-    def place_gamebuttons (self, screen: wdg.Screen) -> None:
+    @tracing.traced()
+    def place_gamebuttons (self, screen: wdg.GameScreen, resolved_scene: ResolvedScene) -> None:
         """
         Wrapper method to generate GameButtons and organize them in their GameButtonLayout
         :param screen: Screen in which the GameButtons must be placed
+        :param resolved_scene: sections and links to display, see StoryEngine.resolve()
         :return: None
         """
-        layout = wdg.GameButtonLayout()
-        game_obj: list[dict] = json_utils.get_sections(self.scene)
-        links: list[dict] = json_utils.get_links(game_obj[-1])  # links are always found in last index of game_obj
+        layout: wdg.GameButtonLayout = screen.button_layout
 
-        if len(links) == 0:  # if no links (end game)
+        if resolved_scene.terminal:  # if no links (end game)
             startmenubutton = self._assemble_startmenubutton(self.language)
             layout.add_widget(startmenubutton)
 
         #else
-        for link in links:
-            conditions:dict = json_utils.get_conditions(link)
-
-            if json_utils.compare_conditions(self.variables, conditions):    #place button if conditions are met
-                gamebutton: wdg.GameButton = self._assemble_gamebutton(text=link["text"],
-                                                                   destination_scene_id=link["destination_scene_id"],
-                                                                   consequences=json_utils.get_consequences(link))
-                layout.add_widget(gamebutton)
-
-        screen.layout.add_widget(layout)
+        for link in resolved_scene.links:  # only links whose conditions are met
+            gamebutton: wdg.GameButton = self._assemble_gamebutton(text=link.text,
+                                                                   destination_scene_id=link.destination_scene_id,
+                                                                   consequences=link.consequences)
+            layout.add_widget(gamebutton)
 
+    @tracing.traced()
     def on_gamebutton_release(self, button: wdg.GameButton) -> None:
         """
         Controls what happens when a GameButton is activated. Must be implemented here within FogApp class because
@@ -346,13 +647,14 @@ class FogApp(App):
         :param button: instance of the button activated
         :return: None
         """
-        self.variables.update(button.consequences)
-        self.scene: dict = self.get_scene(button.destination_scene_id)
+        prepared: Optional[PreparedScreen] = self.discard_prepared_gamescreens(keep=button)
+        self.engine.follow_link(button.destination_scene_id, button.consequences)
+        self.audio.prefetch(self.scene.id)
         if self.soundtrack is not None:
             self.update_soundtrack(self.get_scene_soundtrack(), loop=True)
-        self.save_game()
+        self.save_game(button)
         self.interface.update_locationlabel(self.get_scene_location())
-        self.show_gamescreen(self.in_game_transition_time)
+        self.show_gamescreen(self.in_game_transition_time, prepared=prepared)
 
     def on_startmenubutton_release(self, button: wdg.GameButton) -> None:
         """
@@ -362,31 +664,30 @@ class FogApp(App):
         :return: None
         """
         self.remove_interface_bar()
+        self.discard_prepared_gamescreens()
         self.reset_variables()
         self.delete_saved_game()
         self.update_soundtrack("opening.mp3", loop=False)
         self.show_screen(wdg.StartMenu)
 
-    @staticmethod
-    def _assemble_gametext(game_obj_section: dict) -> wdg.GameTextLabel:
+    def _assemble_gametext(self, game_obj_section: list[str]) -> wdg.GameTextLabel:
         """
         Assembles a TextLabel with the game text at leaves it ready to place in the GameLayout
-        :param game_obj_section: section from the game_obj the text to display
+        :param game_obj_section: text to display and its alignment, as returned by json_utils.align()
         :return: GameTextLabel instance containing the text
         """
-        return wdg.GameTextLabel(text=game_obj_section[0], halign=game_obj_section[1])
+        return self.screen_pool.get_label(text=game_obj_section[0], halign=game_obj_section[1])
 
-    def _assemble_gamebutton(self, text: str, destination_scene_id: int, consequences: dict) -> wdg.GameButton:
+    def _assemble_gamebutton(self, text: str, destination_scene_id: int, consequences: Rules) -> wdg.GameButton:
         """
         Assembles a GameButton and leaves it ready to place in the ButtonLayout
         :param text: text of the GameButton
         :param destination_scene_id: section id where GameButton leads when pressed
-        :param consequences: consequences of the pressing of the GameButton
+        :param consequences: compiled consequences of the pressing of the GameButton
         :return: GameButton instance
         """
-        gamebutton = wdg.GameButton(text=text, destination_scene_id=destination_scene_id, consequences=consequences)
-        gamebutton.bind(on_release=self.on_gamebutton_release)
-        return gamebutton
+        return self.screen_pool.get_button(text=text, destination_scene_id=destination_scene_id,
+                                           consequences=consequences, on_release=self.on_gamebutton_release)
 
     def _assemble_startmenubutton(self, language: str) -> wdg.StartMenuButton:
         """
@@ -398,18 +699,23 @@ class FogApp(App):
         startmenubutton.bind(on_release=self.on_startmenubutton_release)
         return startmenubutton
 
-    @staticmethod
-    def _assemble_gameimage(img_path: str) -> wdg.ImageLayout:
+    def get_pictures_width(self) -> float:
+        """
+        Gets the width available to the in-game pictures: the width of the window in pixels, without the margins
+        laid out in dp, which take more pixels on denser screens (see Metrics.density)
+        :return: width in pixels
+        """
+        return max(1.0, self.root_window.width - PICTURES_MARGIN * Metrics.density)
+
+    def _assemble_gameimage(self, img_name: str) -> wdg.ImageLayout:
         """
-        Assembles a GameImage at leaves it ready to place in the GameLayout
-        :param img_path: path to the png image
+        Assembles a GameImage at leaves it ready to place in the GameLayout. The picture is shown from its smallest
+        variant covering the width available to it (see FogApp.get_pictures_width())
+        :param img_name: file name of the image in pics/ folder
         :return: the Image embedded in its own ImageLayout
         """
-        layout = wdg.ImageLayout()  # images must be embedded in BoxLayouts in order to specify padding
-        image_path = get_resource_path(img_path)  # image folder must be named "pics"
-        gameimage = wdg.GameImage(source=image_path)
-        layout.add_widget(gameimage)
-        return layout
+        return self.screen_pool.get_image(texture=self.images.get(img_name, self.get_pictures_width()),
+                                          size=self.images.get_size(img_name))
 
 ######################################################### START APP ###################################################
 
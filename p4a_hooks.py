@@ -0,0 +1,32 @@
+##################################################################################################################
+##                                    ANDROID PACKAGING HOOKS                                                   ##
+##################################################################################################################
+
+# Hooks run by python-for-android while buildozer packages the app (see p4a.hook in buildozer.spec). The sources of
+# the soundtracks (mp3) are not packaged: before the APK is built, their variants of the android profile are built in
+# soundtracks/ (needs ffmpeg; only variants whose source or settings changed are transcoded again) and copied into
+# the app, with the manifest listing them.
+
+import sys
+from os import makedirs, path
+from shutil import copy2
+
+PROJECT_DIR: str = path.dirname(path.abspath(__file__))
+sys.path.insert(0, PROJECT_DIR)  # p4a loads this file from its path, not as a module of the project
+
+from audio_assets import MANIFEST_PATH, build_variants  # noqa: E402
+
+
+def before_apk_build(toolchain) -> None:
+    """
+    Builds the variants of the soundtracks for the android profile and adds them to the app being packaged
+    :param toolchain: python-for-android toolchain. Its args.private is the copy of the app packaged by buildozer
+    :return: None
+    """
+    soundtracks_dir: str = path.join(PROJECT_DIR, path.dirname(MANIFEST_PATH))
+    manifest: dict = build_variants(soundtracks_dir, ("android",))
+    app_dir: str = path.join(toolchain.args.private, path.dirname(MANIFEST_PATH))
+    makedirs(path.join(app_dir, "android"), exist_ok=True)
+    copy2(path.join(soundtracks_dir, path.basename(MANIFEST_PATH)), app_dir)
+    for variant in manifest["profiles"]["android"].values():
+        copy2(path.join(soundtracks_dir, variant["file"]), path.join(app_dir, variant["file"]))
@@ -1,12 +1,20 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+import sys
+
 from kivy_deps import sdl2, glew
 
 path = 'C:\\Users\\Pol Alonso\\Desktop\\Niebla_v3_windows\\'
+sys.path.insert(0, path)
+
+from audio_assets import build_variants
 
 # Pyinstaller automatically includes all files and folders of the path directory in the build
 # (.json, .kv, .png, .ttf, non-main .py files, etc) and detects all imports (json, re, etc)
 # to build, navigate to the game directory an type -> pyinstaller pyinstaller.spec
+# soundtracks play from their variants of the desktop profile, built here (needs ffmpeg; only variants whose source or
+# settings changed are transcoded again) and listed in soundtracks/manifest.json. Their sources (mp3) are left out
+desktop_variants = build_variants(path + 'soundtracks', ('desktop',))['profiles']['desktop']
 
 a = Analysis(
     ['main.py'],     
@@ -47,7 +55,7 @@ exe = EXE(
     entitlements_file=None,
 )
 coll = COLLECT(
-    exe, Tree(path),
+    exe, Tree(path, excludes=["android", "p4a_hooks.py", *desktop_variants]),  # android variants, sources with a variant
     a.binaries,
     a.datas,
     *[Tree(p) for p in (sdl2.dep_bins + glew.dep_bins)],
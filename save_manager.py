@@ -0,0 +1,277 @@
+import logging
+from json import dumps, load, loads
+from os import fsync, path, remove, replace
+from threading import Condition, Lock, Thread
+from typing import Callable, Optional
+
+import tracing
+
+# The saved game is a journal of JSON lines: full snapshots of the game state ({"snapshot": state}), choices made
+# since ({"choice": {"scene": destination id, "set": {variable: value}}}) and undone choices ({"undo": 1}).
+# Only the variables set by a choice are written, and snapshots are only taken every SNAPSHOT_INTERVAL choices.
+SNAPSHOT_INTERVAL: int = 25  # choices between snapshots
+COMPACT_AFTER: int = 200  # records appended to the journal before it is compacted
+
+Logger: logging.Logger = logging.getLogger("kivy")  # the logger of Kivy, without importing it
+
+# state of a game: a snapshot and the choices made since, see StoryEngine.load()
+History = tuple[dict, list[dict]]
+
+
+class SaveManager:
+    """
+    Write-behind saving of the game as an append-only journal. save() returns immediately: a writer thread appends
+    the new records in the background, and rewrites the journal (under a temporary name, then renamed) when it grows
+    beyond COMPACT_AFTER records, keeping the last two snapshots so the last choices can still be undone. The
+    history of the game is kept in memory, so load() and exists see it even before it reaches the disk
+    """
+    def __init__(self, filename: str, legacy_filename: Optional[str] = None):
+        self.filename: str = filename
+        self.legacy_filename: Optional[str] = legacy_filename  # single state file of former versions, if any
+        self._snapshots: list[tuple[int, dict]] = []  # (number of choices made before, state), oldest first
+        self._choices: list[dict] = []  # choices made since the first snapshot
+        self._lines: list[str] = []  # records waiting for the writer
+        self._rewrite: bool = False  # if True, the writer rewrites the journal from the history in memory
+        self._records: int = 0  # records in the journal file
+        self._writing: bool = False
+        self._generation: int = 0  # increased on delete() and begin(), so records of a former game are never written
+        self._condition: Condition = Condition()
+        self._file_lock: Lock = Lock()
+        self._writer: Optional[Thread] = None
+
+    @property
+    def exists(self) -> bool:
+        """
+        Checks if there is a saved game that can be loaded (a journal without any readable snapshot, e.g. damaged,
+        is not). Reads it from the disk if it was not read yet
+        :return: True if saved game, else False
+        """
+        return self.load() is not None
+
+    @property
+    def can_undo(self) -> bool:
+        """
+        Checks if the last choice can be undone (choices older than the first snapshot kept cannot)
+        :return: True if there is a choice to undo, else False
+        """
+        return bool(self._snapshots) and len(self._choices) > self._snapshots[0][0]
+
+    def begin(self, game_state: dict) -> None:
+        """
+        Starts the history of a new game. Nothing is written until the first choice, so a former saved game is kept
+        until then
+        :param game_state: state at the beginning of the game, must not be modified afterwards
+        :return: None
+        """
+        with self._condition:
+            self._generation += 1
+            self._snapshots = [(0, game_state)]
+            self._choices = []
+            self._lines = []
+            self._rewrite = True
+
+    def save(self, choice: dict, get_state: Callable[[], dict]) -> None:
+        """
+        Records a choice to be appended to the journal, with a snapshot every SNAPSHOT_INTERVAL choices
+        :param choice: choice made, see StoryEngine.get_choice(). Must be JSON serializable and not modified afterwards
+        :param get_state: gets the game state once the choice is made, only called when a snapshot is due
+        :return: None
+        """
+        with self._condition:
+            self._choices.append(choice)
+            self._lines.append(dumps({"choice": choice}, separators=(",", ":")))
+            if len(self._choices) - self._snapshots[-1][0] >= SNAPSHOT_INTERVAL:
+                self._snapshots.append((len(self._choices), get_state()))
+                self._lines.append(dumps({"snapshot": self._snapshots[-1][1]}, separators=(",", ":")))
+            self._condition.notify_all()
+        self._start_writer()
+
+    def undo(self) -> Optional[History]:
+        """
+        Undoes the last choice
+        :return: the history up to the choice before, None if there is no choice to undo
+        """
+        with self._condition:
+            if not self.can_undo:
+                return None
+            self._choices.pop()
+            while self._snapshots[-1][0] > len(self._choices):
+                self._snapshots.pop()
+            self._lines.append(dumps({"undo": 1}, separators=(",", ":")))
+            self._condition.notify_all()
+            history: History = self._get_history()
+        self._start_writer()
+        return history
+
+    def load(self) -> Optional[History]:
+        """
+        Gets the saved game, from memory if it was saved during this session or from the disk otherwise
+        :return: the last snapshot and the choices made since, or None if there is no saved game
+        """
+        with self._condition:
+            if self._snapshots:
+                return self._get_history()
+        if path.exists(self.filename):
+            self._read_journal()
+        elif self.legacy_filename is not None and path.exists(self.legacy_filename):
+            with open(self.legacy_filename, "r") as f:
+                try:
+                    game_state: dict = load(f)
+                except ValueError:  # damaged, as if there was no saved game
+                    return None
+            self.begin(game_state)  # converted into a journal on the next choice
+        with self._condition:
+            return self._get_history() if self._snapshots else None
+
+    def delete(self) -> None:
+        """
+        Deletes the saved game, including records still waiting for the writer
+        :return: None
+        """
+        with self._condition:
+            self._generation += 1
+            self._snapshots = []
+            self._choices = []
+            self._lines = []
+            self._rewrite = False
+        with self._file_lock:
+            for filename in (self.filename, self.legacy_filename):
+                if filename is not None and path.exists(filename):
+                    remove(filename)
+            self._records = 0
+
+    def flush(self) -> None:
+        """
+        Blocks until all records are written. Call before the app may be killed (on_pause, on_stop). Returns if the
+        writer is not running, so it never waits for records no one will write
+        :return: None
+        """
+        with self._condition:
+            while (self._lines or self._writing) and self._writer is not None and self._writer.is_alive():
+                self._condition.wait(0.1)
+
+    def _get_history(self) -> History:
+        """
+        Gets the last snapshot and the choices made since. Must be called holding self._condition
+        :return: the history
+        """
+        index, game_state = self._snapshots[-1]
+        return game_state, self._choices[index:]
+
+    def _read_journal(self) -> None:
+        """
+        Reads the history from the journal. A last record cut by a crash while appending is ignored
+        :return: None
+        """
+        snapshots: list[tuple[int, dict]] = []
+        choices: list[dict] = []
+        records: int = 0
+        damaged: bool = False
+        with open(self.filename, "r") as f:
+            for line in f:
+                try:
+                    record: dict = loads(line)
+                except ValueError:
+                    damaged = True
+                    break
+                records += 1
+                if "snapshot" in record:
+                    snapshots.append((len(choices), record["snapshot"]))
+                elif "choice" in record:
+                    choices.append(record["choice"])
+                elif "undo" in record and snapshots and len(choices) > snapshots[0][0]:
+                    choices.pop()
+                    while snapshots[-1][0] > len(choices):
+                        snapshots.pop()
+        with self._condition:
+            if snapshots:
+                self._snapshots, self._choices = snapshots, choices
+            self._records = records
+            self._rewrite = damaged  # records appended after the damaged one would never be read
+
+    def _start_writer(self) -> None:
+        if self._writer is None:
+            self._writer = Thread(target=self._work, daemon=True)
+            self._writer.start()
+
+    def _work(self) -> None:
+        """
+        Writer loop, appends the pending records, or rewrites the journal if it is new or due to be compacted
+        :return: None
+        """
+        while True:
+            with self._condition:
+                while not self._lines:  # a new game is only written with its first choice
+                    self._condition.wait()
+                generation: int = self._generation
+                self._writing = True
+            try:
+                with self._condition:
+                    if self._rewrite or self._records + len(self._lines) > COMPACT_AFTER:
+                        self._compact()
+                        lines, rewrite = self._get_lines(), True
+                    else:
+                        lines, rewrite = self._lines, False
+                    self._lines = []
+                    self._rewrite = False
+                self._write(generation, lines, rewrite)
+            # any error (e.g. disk full, a state that cannot be serialized) keeps the writer alive. The history is
+            # still in memory, so the next write rewrites the whole journal
+            except Exception as error:
+                Logger.warning(f"SaveManager: could not write {self.filename}: {error}")
+                with self._condition:
+                    self._lines = []  # in the history already, flush() must not wait for them
+                    self._rewrite = self._rewrite or generation == self._generation
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def _compact(self) -> None:
+        """
+        Drops the history older than the second last snapshot. Must be called holding self._condition
+        :return: None
+        """
+        index: int = self._snapshots[-2][0] if len(self._snapshots) > 1 else self._snapshots[0][0]
+        self._snapshots = [(snapshot_index - index, game_state) for snapshot_index, game_state in self._snapshots
+                           if snapshot_index >= index]
+        self._choices = self._choices[index:]
+
+    def _get_lines(self) -> list[str]:
+        """
+        Gets the records of the whole history. Must be called holding self._condition
+        :return: one JSON line per record
+        """
+        lines: list[str] = []
+        snapshots: list[tuple[int, dict]] = self._snapshots
+        position: int = 0
+        for index, choice in enumerate(self._choices + [None]):
+            while position < len(snapshots) and snapshots[position][0] == index:
+                lines.append(dumps({"snapshot": snapshots[position][1]}, separators=(",", ":")))
+                position += 1
+            if choice is not None:
+                lines.append(dumps({"choice": choice}, separators=(",", ":")))
+        return lines
+
+    @tracing.traced()
+    def _write(self, generation: int, lines: list[str], rewrite: bool) -> None:
+        """
+        Appends records to the journal, or writes the whole journal to a temporary file and renames it
+        :param generation: value of self._generation when the records were taken
+        :param lines: records to write
+        :param rewrite: if True, lines are the whole journal
+        :return: None
+        """
+        tmp_filename: str = self.filename + ".tmp"
+        with self._file_lock:
+            if generation != self._generation:  # deleted or new game meanwhile
+                return
+            with open(tmp_filename if rewrite else self.filename, "w" if rewrite else "a") as f:
+                f.write("".join(line + "\n" for line in lines))
+                f.flush()
+                fsync(f.fileno())
+            if rewrite:
+                replace(tmp_filename, self.filename)
+                if self.legacy_filename is not None and path.exists(self.legacy_filename):
+                    remove(self.legacy_filename)  # converted into the journal
+            self._records = len(lines) if rewrite else self._records + len(lines)
@@ -0,0 +1,120 @@
+##################################################################################################################
+##                                    COMPILED STORY CACHE                                                      ##
+##################################################################################################################
+
+# Parsing and formatting a story is the heaviest part of FogApp.setup_game(). The result (formatted scenes,
+# variable table, intro id and pictures used) is stored in a compact binary file keyed by a hash of the source
+# JSON, so it is only rebuilt when the story changes. Run "python story_cache.py languages/*.json" to precompile
+# at build time.
+# Stories formatted lazily (see StoryGraph) are cached with their raw scenes in a separate file.
+
+import hashlib
+import json
+import marshal
+import sys
+from os import path, remove, replace
+
+import json_utils
+
+CACHE_VERSION: int = 3  # bump whenever the formatting functions or the compiled layout change
+CACHE_EXTENSION: str = ".storycache"
+RAW_CACHE_EXTENSION: str = ".raw.storycache"
+
+
+def get_cache_path(source_path: str, formatted: bool = True) -> str:
+    """
+    Gets the path of the cache file of a story, stored next to its source JSON
+    :param source_path: path to the JSON containing the story
+    :param formatted: if False, path to the cache file holding the raw (not formatted) scenes
+    :return: path to the cache file
+    """
+    return path.splitext(source_path)[0] + (CACHE_EXTENSION if formatted else RAW_CACHE_EXTENSION)
+
+
+def get_source_key(raw_story: bytes) -> str:
+    """
+    Gets the key identifying a compiled story. Depends on the source JSON, the cache version and the marshal format
+    :param raw_story: content of the JSON containing the story
+    :return: hex digest identifying the source
+    """
+    digest = hashlib.sha1(raw_story)
+    digest.update(f"{CACHE_VERSION}:{marshal.version}:{sys.version_info[:2]}".encode())
+    return digest.hexdigest()
+
+
+def compile_story(raw_story: bytes, formatted: bool = True) -> dict:
+    """
+    Parses and formats a story and packs everything FogApp needs at setup
+    :param raw_story: content of the JSON containing the story
+    :param formatted: if False, scenes are left as in the JSON (to be formatted later, one at a time)
+    :return: dict with title, scenes, variables, intro id and names of the pictures
+    """
+    story: dict = json.loads(raw_story)
+    scenes: list[dict] = json_utils.get_scenes(story, formatted=formatted)
+    return {"title": story["title"],
+            "scenes": scenes,
+            "variables": json_utils.get_variables(scenes),
+            "intro_id": json_utils.get_intro(scenes, id_only=True),
+            "images": json_utils.get_image_names(scenes)}
+
+
+def read_cache(cache_path: str, key: str) -> dict | None:
+    """
+    Reads a compiled story from its cache file
+    :param cache_path: path to the cache file
+    :param key: expected key of the compiled story
+    :return: the compiled story, or None if the file is missing, corrupted or outdated
+    """
+    try:
+        with open(cache_path, "rb") as f:
+            cache: dict = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(cache, dict) or cache.get("key") != key:
+        return None
+    return cache["story"]
+
+
+def write_cache(cache_path: str, key: str, compiled_story: dict) -> None:
+    """
+    Writes a compiled story to its cache file. The file is written under a temporary name and then renamed,
+    so an interrupted write never leaves a corrupted cache behind
+    :param cache_path: path to the cache file
+    :param key: key of the compiled story
+    :param compiled_story: compiled story as returned by compile_story()
+    :return: None
+    """
+    tmp_path: str = cache_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            marshal.dump({"key": key, "story": compiled_story}, f)
+        replace(tmp_path, cache_path)
+    except OSError:  # a read-only location only means the story is compiled again next time
+        if path.exists(tmp_path):
+            remove(tmp_path)
+
+
+def load_story(source_path: str, formatted: bool = True) -> dict:
+    """
+    Loads a compiled story, from its cache file if it is up to date or compiling it (and caching it) otherwise
+    :param source_path: path to the JSON containing the story
+    :param formatted: if False, scenes are loaded without formatting (to be formatted later, one at a time)
+    :return: dict with title, scenes, variables, intro id and names of the pictures
+    """
+    with open(source_path, "rb") as f:
+        raw_story: bytes = f.read()
+    key: str = get_source_key(raw_story)
+    cache_path: str = get_cache_path(source_path, formatted)
+
+    compiled_story: dict | None = read_cache(cache_path, key)
+    if compiled_story is None:
+        compiled_story = compile_story(raw_story, formatted)
+        write_cache(cache_path, key, compiled_story)
+    return compiled_story
+
+
+if __name__ == '__main__':
+    for source in sys.argv[1:]:
+        for formatted in (True, False):
+            load_story(source, formatted)
+            print(f"Compiled {source} -> {get_cache_path(source, formatted)}")
@@ -0,0 +1,139 @@
+from typing import NamedTuple, Optional, Sequence
+
+import tracing
+from game_state import GameState, Rules
+from json_utils import Scene
+from story_graph import StoryGraph
+
+
+class ResolvedLink(NamedTuple):
+    """
+    Link of a scene whose conditions are met, ready to be displayed as a GameButton
+    """
+    text: str  # formatted text
+    destination_scene_id: int
+    consequences: Rules
+
+
+class ResolvedScene(NamedTuple):
+    """
+    What a scene shows for given variables: the sections and links whose conditions are met
+    """
+    scene_id: int
+    texts: tuple[str, ...]  # formatted texts of the sections shown, "[$image]" + file name for pictures
+    links: tuple[ResolvedLink, ...]
+    terminal: bool  # if True, the scene ends the game
+
+
+class StoryEngine:
+    """
+    Story logic, independent of Kivy: current scene and variables, resolution of what a scene shows (conditions
+    checked and consequences applied) and moves from scene to scene. FogApp drives it and turns its output into
+    widgets, so the engine can also run (and be measured) without a window
+    """
+    def __init__(self, graph: StoryGraph):
+        self.graph: StoryGraph = graph
+        self.variables: GameState = GameState(graph.variable_names)
+        self.scene: Optional[Scene] = None
+
+    def start(self) -> Scene:
+        """
+        Moves to the first scene of the story
+        :return: the intro scene
+        """
+        self.scene = self.graph.intro
+        return self.scene
+
+    def reset(self) -> None:
+        """
+        Sets all variables back to 0
+        :return: None
+        """
+        self.variables.reset()
+
+    def get_state(self) -> dict:
+        """
+        Gets the game state, as saved in saved_game.json
+        :return: dict with the variables and the id of the current scene
+        """
+        return {"variables": self.variables.as_dict(),
+                "current_scene_id": self.scene.id}
+
+    def get_choice(self, destination_scene_id: int, consequences: Rules) -> dict:
+        """
+        Gets a link followed, as saved in the journal of saved_game.journal (see SaveManager)
+        :param destination_scene_id: id of the destination scene
+        :param consequences: compiled consequences of the link
+        :return: dict with the destination and the variables set by the link
+        """
+        return {"scene": destination_scene_id,
+                "set": {self.variables.names[slot]: value for slot, value in consequences}}
+
+    def load(self, game_state: dict, choices: Sequence[dict] = ()) -> Scene:
+        """
+        Overwrites the variables and the current scene with a saved game state, then replays the choices made since.
+        Replaying a choice applies the consequences of the sections of the current scene and of the link followed,
+        without resolving any text
+        :param game_state: game state as returned by get_state()
+        :param choices: choices made since, as returned by get_choice()
+        :return: the current scene
+        """
+        self.variables.reset()
+        self.variables.update_from_dict(game_state["variables"])
+        self.scene = self.graph.get_scene(game_state["current_scene_id"])
+        for choice in choices:
+            for conditions, consequences in self.graph.get_section_rules(self.scene.id):
+                if self.variables.meets(conditions):
+                    self.variables.apply(consequences)
+            self.variables.update_from_dict(choice["set"])
+            self.scene = self.graph.get_scene(choice["scene"])
+        return self.scene
+
+    @tracing.traced()
+    def follow_link(self, destination_scene_id: int, consequences: Rules) -> Scene:
+        """
+        Applies the consequences of a link and moves to its destination
+        :param destination_scene_id: id of the destination scene
+        :param consequences: compiled consequences of the link
+        :return: the new current scene
+        """
+        self.variables.apply(consequences)
+        self.scene = self.graph.get_scene(destination_scene_id)
+        return self.scene
+
+    def predict(self, consequences: Rules) -> GameState:
+        """
+        Gets the variables after following a link, without changing the current ones
+        :param consequences: compiled consequences of the link
+        :return: copy of the variables with the consequences applied
+        """
+        variables: GameState = self.variables.copy()
+        variables.apply(consequences)
+        return variables
+
+    @tracing.traced()
+    def resolve(self, scene: Optional[Scene] = None, variables: Optional[GameState] = None) -> ResolvedScene:
+        """
+        Gets the sections and links a scene shows. Consequences of the sections shown are applied to the variables
+        :param scene: scene to resolve, the current scene by default
+        :param variables: variables to check and update, the current ones by default
+        :return: the resolved scene
+        """
+        scene_id: int = (self.scene if scene is None else scene).id
+        if variables is None:
+            variables = self.variables
+        section_texts, link_texts = self.graph.get_texts(scene_id)
+
+        texts: list[str] = []
+        for text, (conditions, consequences) in zip(section_texts, self.graph.get_section_rules(scene_id)):
+            if variables.meets(conditions):
+                texts.append(text)
+                variables.apply(consequences)  # consequences checked for both texts and images
+
+        # links are checked once all sections are shown, as their consequences may unlock links
+        links: list[ResolvedLink] = [
+            ResolvedLink(text, link.destination_scene_id, consequences)
+            for link, text, (conditions, consequences) in zip(self.graph.get_links(scene_id), link_texts,
+                                                              self.graph.get_link_rules(scene_id))
+            if variables.meets(conditions)]
+        return ResolvedScene(scene_id, tuple(texts), tuple(links), self.graph.is_terminal(scene_id))
@@ -0,0 +1,239 @@
+##################################################################################################################
+##                                    STORY STATE-SPACE EXPLORER                                                ##
+##################################################################################################################
+
+# A story is a finite state machine over (scene id, values of the variables). This tool enumerates every state
+# reachable from the intro, breadth first, and reports unreachable scenes, dead ends (scenes left without any
+# visible link), unused variables, endings reached and the depth distribution.
+# Each level of the search is split in chunks expanded by a pool of processes. States are encoded in a few bytes
+# (see encode_state()) and deduplicated through a set of their encodings, so memory grows with the number of
+# distinct states only. Run "python story_explorer.py languages/Fog.json [--workers N] [--max-states N]".
+
+import argparse
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from time import perf_counter
+from typing import NamedTuple, Optional
+
+import story_cache
+from game_state import Rules
+from story_graph import StoryGraph
+
+CHUNK_SIZE: int = 2000  # states expanded per task
+
+# set in each process by init_worker()
+_graph: Optional[StoryGraph] = None
+_typecode: str = "i"
+
+
+class ExplorationReport(NamedTuple):
+    """
+    Results of the exploration of a story
+    """
+    states: int  # distinct states reached
+    depth_counts: list[int]  # new states found at each depth (number of links followed from the intro)
+    unreachable_ids: list[int]  # scenes never reached
+    dead_ends: Counter  # scene id: states in the scene without any visible link, scene not being an ending
+    endings: Counter  # scene id: states in the scene, for scenes ending the game
+    unchanged_variables: list[str]  # variables whose value never changes, so their conditions never change either
+    unchecked_variables: list[str]  # variables set by consequences but never checked by any condition
+    truncated: bool  # if True, max_states was reached before the exploration was complete
+    seconds: float
+
+
+def load_graph(source_path: str) -> StoryGraph:
+    """
+    Loads the story without formatting its texts, which the explorer does not need
+    :param source_path: path to the JSON containing the story
+    :return: graph of the story
+    """
+    story: dict = story_cache.load_story(source_path, formatted=False)
+    return StoryGraph(story["scenes"], intro_id=story["intro_id"], variables=story["variables"], formatted=False)
+
+
+def get_typecode(graph: StoryGraph) -> str:
+    """
+    Gets the smallest array typecode fitting every value the variables can take (0 or a consequence value)
+    :param graph: graph of the story
+    :return: array typecode
+    """
+    values: list[int] = [0] + [value for scene_id in graph.scenes
+                               for rules in graph.get_section_rules(scene_id) + graph.get_link_rules(scene_id)
+                               for slot, value in rules[1]]
+    for typecode, limit in (("b", 1 << 7), ("h", 1 << 15)):
+        if -limit <= min(values) and max(values) < limit:
+            return typecode
+    return "i"
+
+
+def encode_state(scene_id: int, values: array) -> bytes:
+    """
+    Encodes a state in 4 bytes for the scene id plus one item of the array (1 byte for most stories) per variable
+    :param scene_id: id of the scene
+    :param values: values of the variables when entering the scene
+    :return: encoded state
+    """
+    return scene_id.to_bytes(4, "little", signed=True) + values.tobytes()
+
+
+def decode_scene_id(state: bytes) -> int:
+    return int.from_bytes(state[:4], "little", signed=True)
+
+
+def init_worker(source_path: str) -> None:
+    """
+    Loads the story once per process
+    :param source_path: path to the JSON containing the story
+    :return: None
+    """
+    global _graph, _typecode
+    _graph = load_graph(source_path)
+    _typecode = get_typecode(_graph)
+
+
+def _meets(values: array, conditions: Rules) -> bool:
+    for slot, value in conditions:
+        if values[slot] != value:
+            return False
+    return True
+
+
+def _apply(values: array, consequences: Rules, changed: set[int]) -> None:
+    for slot, value in consequences:
+        if values[slot] != value:
+            values[slot] = value
+            changed.add(slot)
+
+
+def expand_states(states: list[bytes]) -> tuple[list[bytes], list[int], set[int]]:
+    """
+    Gets the successors of states, following every link visible in each of them. Runs in the worker processes
+    :param states: encoded states
+    :return: encoded successors (without duplicates), ids of the dead-end scenes of states without successors,
+    slots of the variables changed by some consequence
+    """
+    graph: StoryGraph = _graph
+    successors: dict[bytes, None] = {}
+    dead_ends: list[int] = []
+    changed: set[int] = set()
+
+    for state in states:
+        scene_id: int = decode_scene_id(state)
+        values = array(_typecode)
+        values.frombytes(state[4:])
+
+        for conditions, consequences in graph.get_section_rules(scene_id):
+            if _meets(values, conditions):
+                _apply(values, consequences, changed)
+
+        found: bool = False
+        for link, (conditions, consequences) in zip(graph.get_links(scene_id), graph.get_link_rules(scene_id)):
+            if _meets(values, conditions):
+                next_values = array(_typecode, values)
+                _apply(next_values, consequences, changed)
+                successors[encode_state(link.destination_scene_id, next_values)] = None
+                found = True
+        if not found and not graph.is_terminal(scene_id):
+            dead_ends.append(scene_id)
+    return list(successors), dead_ends, changed
+
+
+def explore(source_path: str, workers: int, chunk_size: int = CHUNK_SIZE,
+            max_states: Optional[int] = None) -> ExplorationReport:
+    """
+    Explores every state reachable from the intro of a story
+    :param source_path: path to the JSON containing the story
+    :param workers: number of processes. With 1, states are expanded in this process
+    :param chunk_size: states expanded per task
+    :param max_states: exploration stops as soon as this number of states is reached (None for no limit)
+    :return: report of the exploration
+    """
+    start_time: float = perf_counter()
+    init_worker(source_path)
+    graph: StoryGraph = _graph
+    start: bytes = encode_state(graph.intro_id, array(_typecode, [0] * len(graph.variable_names)))  # all at 0
+    visited: set[bytes] = {start}
+    frontier: list[bytes] = [start]
+    depth_counts: list[int] = [1]
+    scene_counts: Counter = Counter({graph.intro_id: 1})
+    dead_ends: Counter = Counter()
+    changed: set[int] = set()
+    truncated: bool = False
+
+    pool: Optional[ProcessPoolExecutor] = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(source_path,))
+    try:
+        while frontier and not truncated:
+            chunks: list[list[bytes]] = [frontier[i:i + chunk_size] for i in range(0, len(frontier), chunk_size)]
+            results = pool.map(expand_states, chunks) if pool is not None else map(expand_states, chunks)
+            frontier = []
+            for successors, chunk_dead_ends, chunk_changed in results:
+                dead_ends.update(chunk_dead_ends)
+                changed |= chunk_changed
+                for state in successors:
+                    if state not in visited:
+                        # checked per state rather than per level, so memory stays bounded on wide levels
+                        if max_states is not None and len(visited) >= max_states:
+                            truncated = True
+                            break
+                        visited.add(state)
+                        frontier.append(state)
+                        scene_counts[decode_scene_id(state)] += 1
+                if truncated:
+                    break
+            if frontier:
+                depth_counts.append(len(frontier))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    checked: set[int] = {slot for scene_id in graph.scenes
+                         for rules in graph.get_section_rules(scene_id) + graph.get_link_rules(scene_id)
+                         for slot, value in rules[0]}
+    return ExplorationReport(
+        states=len(visited),
+        depth_counts=depth_counts,
+        unreachable_ids=sorted(scene_id for scene_id in graph.scenes if scene_id not in scene_counts),
+        dead_ends=dead_ends,
+        endings=Counter({scene_id: count for scene_id, count in scene_counts.items() if graph.is_terminal(scene_id)}),
+        unchanged_variables=[name for slot, name in enumerate(graph.variable_names) if slot not in changed],
+        unchecked_variables=[name for slot, name in enumerate(graph.variable_names)
+                             if slot in changed and slot not in checked],
+        truncated=truncated,
+        seconds=perf_counter() - start_time)
+
+
+def print_report(report: ExplorationReport) -> None:
+    """
+    Prints a report in a human readable form
+    :param report: report of the exploration
+    :return: None
+    """
+    print(f"States: {report.states}{' (truncated)' if report.truncated else ''}, "
+          f"{report.seconds:.2f} s ({report.states / max(report.seconds, 1e-9):.0f} states/s)")
+    print(f"Max depth: {len(report.depth_counts) - 1}")
+    for depth, count in enumerate(report.depth_counts):
+        print(f"  depth {depth:>4}: {count}")
+    print(f"Unreachable scenes ({len(report.unreachable_ids)}): {report.unreachable_ids}")
+    print(f"Dead ends ({len(report.dead_ends)}): " +
+          ", ".join(f"{scene_id} ({count} states)" for scene_id, count in sorted(report.dead_ends.items())))
+    print(f"Endings reached ({len(report.endings)}): " +
+          ", ".join(f"{scene_id} ({count} states)" for scene_id, count in sorted(report.endings.items())))
+    print(f"Variables never changed ({len(report.unchanged_variables)}): {report.unchanged_variables}")
+    print(f"Variables never checked ({len(report.unchecked_variables)}): {report.unchecked_variables}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Enumerates every state reachable in a story")
+    parser.add_argument("stories", nargs="+", help="paths to the JSON files containing the stories")
+    parser.add_argument("--workers", type=int, default=cpu_count() or 1, help="number of processes")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="states expanded per task")
+    parser.add_argument("--max-states", type=int, default=None, help="stop after reaching this number of states")
+    args = parser.parse_args()
+
+    for source in args.stories:
+        print(f"=== {source}")
+        print_report(explore(source, args.workers, args.chunk_size, args.max_states))
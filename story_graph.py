@@ -0,0 +1,204 @@
+from __future__ import annotations  # StoryTexts is only imported for type checking
+
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Mapping, Optional
+
+import json_utils
+from game_state import Rules
+from json_utils import Link, Scene, Section
+
+if TYPE_CHECKING:
+    from story_model import StoryTexts
+
+
+class StoryGraph:
+    """
+    Indexed view of the scenes of a story. Built once after loading the story, it gives constant time access to
+    scenes by id, to their sections and links and to their outgoing edges. Scenes are turned into read-only Scene
+    records (see json_utils.build_scenes()) when the graph is built, so callers get shared views instead of copies.
+    Conditions and consequences are compiled at the same time into (slot, value) pairs indexing a GameState.
+    If scenes are not formatted, the texts of each scene are formatted the first time they are requested and kept
+    in a LRU cache of max_formatted_scenes scenes, so setup cost and memory do not grow with the story.
+    Texts may also be taken from a StoryTexts table (see set_texts()), so several languages share the same graph
+    """
+    def __init__(self, scenes: list[dict], intro_id: Optional[int] = None, variables: Optional[dict] = None,
+                 formatted: bool = True, max_formatted_scenes: int = 32):
+        records: list[Scene] = json_utils.build_scenes(scenes)
+
+        # slot order follows the variable table (if any), variables only found in consequences are appended
+        slots: dict[str, int] = {name: slot for slot, name in enumerate(variables or ())}
+        compiled: dict[tuple, Rules] = {}  # items with the same rules share their compiled rules
+
+        def compile_rules(rules: tuple) -> Rules:
+            if rules not in compiled:
+                compiled[rules] = json_utils.compile_rules(rules, slots)
+            return compiled[rules]
+
+        self._section_rules: dict[int, tuple[tuple[Rules, Rules], ...]] = {
+            scene.id: tuple((compile_rules(section.conditions), compile_rules(section.consequences))
+                            for section in scene.sections)
+            for scene in records}
+        self._link_rules: dict[int, tuple[tuple[Rules, Rules], ...]] = {
+            scene.id: tuple((compile_rules(link.conditions), compile_rules(link.consequences))
+                            for link in scene.sections[-1].links)
+            for scene in records}
+        self.variable_names: tuple[str, ...] = tuple(slots)
+
+        self._scenes: dict[int, Scene] = {scene.id: scene for scene in records}
+        self.scenes: Mapping[int, Scene] = MappingProxyType(self._scenes)
+        # links are always found in the last section of the scene
+        self._links: dict[int, tuple[Link, ...]] = {scene.id: scene.sections[-1].links for scene in records}
+        self._destinations: dict[int, tuple[int, ...]] = {
+            scene.id: tuple(dict.fromkeys(link.destination_scene_id for section in scene.sections
+                                          for link in section.links))
+            for scene in records}
+
+        self.all_destinations: frozenset[int] = frozenset(destination for destinations in self._destinations.values()
+                                                          for destination in destinations)
+        self.terminal_ids: frozenset[int] = frozenset(scene_id for scene_id, links in self._links.items()
+                                                      if len(links) == 0)
+        self.intro_ids: frozenset[int] = frozenset(scene_id for scene_id in self._scenes
+                                                   if scene_id not in self.all_destinations)
+        if intro_id is None:  # same criterion as json_utils.get_intro(), without scanning the links again
+            intro_id = next(scene.id for scene in records if scene.id in self.intro_ids)
+        self.intro_id: int = intro_id
+
+        self.formatted: bool = formatted
+        self.max_formatted_scenes: int = max_formatted_scenes
+        self._texts: OrderedDict[int, tuple[tuple[str, ...], tuple[str, ...]]] = OrderedDict()
+        self.story_texts: Optional[StoryTexts] = None  # if None, texts are taken from the scenes
+
+    def __len__(self) -> int:
+        return len(self._scenes)
+
+    def __contains__(self, scene_id: int) -> bool:
+        return scene_id in self._scenes
+
+    @property
+    def intro(self) -> Scene:
+        """
+        Gets the first scene of the story
+        :return: the intro scene
+        """
+        return self._scenes[self.intro_id]
+
+    def get_scene(self, scene_id: int) -> Scene:
+        """
+        Gets the scene with the passed id
+        :param scene_id: id of the scene to get
+        :return: scene
+        """
+        return self._scenes[scene_id]
+
+    def get_sections(self, scene_id: int) -> tuple[Section, ...]:
+        """
+        Gets the sections of a scene
+        :param scene_id: id of the scene
+        :return: read-only sequence of sections
+        """
+        return self._scenes[scene_id].sections
+
+    def get_links(self, scene_id: int) -> tuple[Link, ...]:
+        """
+        Gets the links of a scene, which are always found in its last section
+        :param scene_id: id of the scene
+        :return: read-only sequence of links
+        """
+        return self._links[scene_id]
+
+    def get_texts(self, scene_id: int) -> tuple[tuple[str, ...], tuple[str, ...]]:
+        """
+        Gets the formatted texts of a scene, formatting them if they are not in the LRU cache yet
+        :param scene_id: id of the scene
+        :return: texts of the sections and texts of the links, in the same order as get_sections() and get_links()
+        """
+        texts = self._texts.get(scene_id)
+        if texts is not None:
+            self._texts.move_to_end(scene_id)
+            return texts
+
+        scene: Scene = self._scenes[scene_id]
+        if self.story_texts is not None:
+            texts = self.story_texts.get_texts(scene_id)
+        elif self.formatted:
+            texts = (tuple(section.text for section in scene.sections),
+                     tuple(link.text for link in self._links[scene_id]))
+        else:
+            texts = json_utils.format_scene_texts(scene)
+
+        self._texts[scene_id] = texts
+        if len(self._texts) > self.max_formatted_scenes:
+            self._texts.popitem(last=False)  # least recently used
+        return texts
+
+    def get_location(self, scene_id: int) -> str:
+        """
+        Gets the location of a scene, in the language of the texts
+        :param scene_id: id of the scene
+        :return: location of the scene
+        """
+        if self.story_texts is not None:
+            return self.story_texts.get_location(scene_id)
+        return self._scenes[scene_id].location
+
+    def set_texts(self, story_texts: Optional[StoryTexts]) -> None:
+        """
+        Sets the table the texts are taken from (e.g. when the language changes)
+        :param story_texts: texts of the story, None to take them from the scenes
+        :return: None
+        """
+        if story_texts is not self.story_texts:
+            self.story_texts = story_texts
+            self._texts.clear()
+
+    def get_section_rules(self, scene_id: int) -> tuple[tuple[Rules, Rules], ...]:
+        """
+        Gets the compiled conditions and consequences of the sections of a scene
+        :param scene_id: id of the scene
+        :return: one (conditions, consequences) pair per section, in the same order as get_sections()
+        """
+        return self._section_rules[scene_id]
+
+    def get_link_rules(self, scene_id: int) -> tuple[tuple[Rules, Rules], ...]:
+        """
+        Gets the compiled conditions and consequences of the links of a scene
+        :param scene_id: id of the scene
+        :return: one (conditions, consequences) pair per link, in the same order as get_links()
+        """
+        return self._link_rules[scene_id]
+
+    def get_destinations(self, scene_id: int) -> tuple[int, ...]:
+        """
+        Gets the ids of all the scenes a scene links to (its outgoing edges), without duplicates
+        :param scene_id: id of the scene
+        :return: ids of the destination scenes
+        """
+        return self._destinations[scene_id]
+
+    def get_reachable_ids(self, scene_id: int, max_depth: int) -> set[int]:
+        """
+        Gets the ids of the scenes reachable from a scene following at most max_depth links, regardless of conditions
+        :param scene_id: id of the starting scene (included in the result)
+        :param max_depth: maximum number of links to follow
+        :return: ids of the reachable scenes
+        """
+        reachable: set[int] = {scene_id}
+        frontier: list[int] = [scene_id]
+        for _ in range(max_depth):
+            next_frontier: list[int] = []
+            for current in frontier:
+                for destination in self._destinations.get(current, ()):
+                    if destination not in reachable:
+                        reachable.add(destination)
+                        next_frontier.append(destination)
+            frontier = next_frontier
+        return reachable
+
+    def is_terminal(self, scene_id: int) -> bool:
+        """
+        Checks if a scene ends the game
+        :param scene_id: id of the scene
+        :return: True if the scene has no links, else False
+        """
+        return scene_id in self.terminal_ids
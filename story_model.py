@@ -0,0 +1,146 @@
+##################################################################################################################
+##                                    MULTI-LANGUAGE STORY MODEL                                                ##
+##################################################################################################################
+
+# The stories in languages/ share the same scenes, links, conditions, consequences and soundtracks, and only differ
+# in their texts. StoryModel builds the StoryGraph of that structure once and keeps one StoryTexts table per story
+# (title, locations and texts of sections and links), set on the graph when the story is selected. preload() loads
+# every story in a background thread while LanguageMenu is shown, so selecting a language does not parse anything.
+# A story whose structure differs from the shared one (e.g. edited on its own) gets a StoryGraph of its own.
+
+import hashlib
+import json
+from threading import Lock, Thread
+from typing import Mapping, Optional
+
+import json_utils
+import story_cache
+from story_graph import StoryGraph
+
+
+class StoryTexts:
+    """
+    Texts of one language of the story, by scene id. Texts are kept formatted or raw, as loaded (see StoryGraph)
+    """
+    def __init__(self, story: dict, formatted: bool):
+        self.title: str = story["title"]
+        self.images: list[str] = story["images"]  # names of the pictures, see ImageCache.decode()
+        self.formatted: bool = formatted
+        self.locations: dict[int, str] = {scene["id"]: scene["location"] for scene in story["scenes"]}
+        self.sections: dict[int, tuple[str, ...]] = {
+            scene["id"]: tuple(section["text"] for section in scene["sections"]) for scene in story["scenes"]}
+        self.links: dict[int, tuple[str, ...]] = {  # links are always found in the last section of the scene
+            scene["id"]: tuple(link["text"] for link in scene["sections"][-1]["links"]) for scene in story["scenes"]}
+
+    def get_texts(self, scene_id: int) -> tuple[tuple[str, ...], tuple[str, ...]]:
+        """
+        Gets the formatted texts of a scene, formatting them if they were loaded raw
+        :param scene_id: id of the scene
+        :return: texts of the sections and texts of the links
+        """
+        if self.formatted:
+            return self.sections[scene_id], self.links[scene_id]
+        return (tuple(json_utils.format_section_text(text) for text in self.sections[scene_id]),
+                tuple(json_utils.format_link_text(text) for text in self.links[scene_id]))
+
+    def get_location(self, scene_id: int) -> str:
+        return self.locations[scene_id]
+
+
+def get_structure_key(story: dict) -> str:
+    """
+    Gets a key identifying the structure of a story: everything but its texts
+    :param story: story as returned by story_cache.load_story()
+    :return: hex digest of the structure
+    """
+    structure: list = [story["intro_id"], list(story["variables"])]
+    for scene in story["scenes"]:
+        structure.append([scene["id"], scene["soundtrack"]])
+        for section in scene["sections"]:
+            structure.append([list(section["conditions"]), list(section["consequences"]),
+                              [[link["destination_scene_id"], list(link["conditions"]), list(link["consequences"])]
+                               for link in section["links"]]])
+    return hashlib.sha1(json.dumps(structure, sort_keys=True).encode()).hexdigest()
+
+
+def strip_texts(scenes: list[dict]) -> None:
+    """
+    Drops the texts of the scenes, which are kept by StoryTexts instead
+    :param scenes: scenes of the story
+    :return: None
+    """
+    for scene in scenes:
+        scene["title"] = scene["location"] = None
+        for section in scene["sections"]:
+            section["text"] = None
+            for link in section["links"]:
+                link["text"] = None
+
+
+class StoryModel:
+    """
+    Story graph shared by all the languages, plus the texts of each language
+    """
+    def __init__(self, sources: Mapping[str, str], formatted: bool = True, max_formatted_scenes: int = 32):
+        self.sources: Mapping[str, str] = sources  # key (e.g. languages/Fog.json): path to the JSON of the story
+        self.formatted: bool = formatted
+        self.max_formatted_scenes: int = max_formatted_scenes
+        self.graph: Optional[StoryGraph] = None  # shared graph
+        self.structure_key: Optional[str] = None  # structure of the shared graph
+        self.graphs: dict[str, StoryGraph] = {}  # key: graph of the story, the shared one unless its structure differs
+        self.texts: dict[str, StoryTexts] = {}
+        self._lock: Lock = Lock()
+        self._preloader: Optional[Thread] = None
+
+    def preload(self) -> None:
+        """
+        Starts loading all the stories in a background thread
+        :return: None
+        """
+        if self._preloader is None:
+            self._preloader = Thread(target=self._preload, daemon=True)
+            self._preloader.start()
+
+    def _preload(self) -> None:
+        for key in self.sources:
+            try:
+                self.load(key)
+            except (OSError, ValueError, KeyError):  # raised again when the story is requested
+                pass
+
+    def load(self, key: str) -> StoryTexts:
+        """
+        Loads a story, unless already loaded. Waits for the background thread if it is loading a story. It may run
+        outside the main thread (see FogApp.setup_game())
+        :param key: key of the story in self.sources
+        :return: texts of the story
+        """
+        with self._lock:
+            if key in self.texts:
+                return self.texts[key]
+            story: dict = story_cache.load_story(self.sources[key], formatted=self.formatted)
+            structure_key: str = get_structure_key(story)
+            texts = StoryTexts(story, self.formatted)
+            strip_texts(story["scenes"])
+
+            if self.graph is not None and structure_key == self.structure_key:
+                graph: StoryGraph = self.graph  # scenes of this story are dropped, only its texts are kept
+            else:
+                graph = StoryGraph(story["scenes"], intro_id=story["intro_id"], variables=story["variables"],
+                                   formatted=self.formatted, max_formatted_scenes=self.max_formatted_scenes)
+                if self.graph is None:
+                    self.graph, self.structure_key = graph, structure_key
+            self.graphs[key] = graph
+            self.texts[key] = texts
+            return texts
+
+    def get(self, key: str) -> tuple[StoryGraph, StoryTexts]:
+        """
+        Gets a story, set to its texts. Only loads it if it was not preloaded
+        :param key: key of the story in self.sources
+        :return: graph of the story and its texts
+        """
+        self.load(key)
+        graph: StoryGraph = self.graphs[key]
+        graph.set_texts(self.texts[key])
+        return graph, self.texts[key]
@@ -0,0 +1,36 @@
+import json
+from os import path
+
+import pytest
+
+import json_utils
+from conftest import ROOT
+
+# texts of every scene of the bundled stories, formatted by the regex cascade format_kivy() replaced
+GOLDEN_PATH: str = path.join(path.dirname(__file__), "golden", "format_kivy.json")
+
+with open(GOLDEN_PATH, "r", encoding="utf-8") as f:
+    GOLDEN: dict[str, dict[str, dict[str, list[str]]]] = json.load(f)
+
+
+@pytest.mark.parametrize("story_path", sorted(GOLDEN))
+def test_story_texts_match_golden(story_path):
+    story: dict = json_utils.read_json(path.join(ROOT, story_path))
+    expected: dict[str, dict[str, list[str]]] = GOLDEN[story_path]
+    assert sorted(expected) == sorted(str(scene["id"]) for scene in story["scenes"])
+    for scene in story["scenes"]:
+        sections: list[str] = [json_utils.format_section_text(section["text"]) for section in scene["sections"]]
+        links: list[str] = [json_utils.format_link_text(link["text"])
+                            for section in scene["sections"] for link in section["links"]]
+        assert sections == expected[str(scene["id"])]["sections"], f"scene {scene['id']}"
+        assert links == expected[str(scene["id"])]["links"], f"scene {scene['id']}"
+
+
+@pytest.mark.parametrize("html, markup", [
+    ('<p>one <i>two</i> <b><u>three</u></b></p>', 'one [i]two[/i] [b][u]three[/u][/b]\n'),
+    ('<p style="text-align: center;">Title</p><p>text</p>', '[$center]Title\n\ntext\n'),
+    ('<p>a <span>b</span><br>c&nbsp;d</p>', 'a bc d\n'),
+    ('<p><i></i>empty pair dropped</p>', 'empty pair dropped\n'),
+])
+def test_format_kivy(html, markup):
+    assert json_utils.format_kivy(html) == markup
@@ -0,0 +1,63 @@
+from conftest import ROOT
+
+TIMEOUT: float = 30.0  # in seconds
+
+
+def get_gamebuttons(screen) -> list:
+    import widgets as wdg
+    return [widget for widget in screen.button_layout.children if isinstance(widget, wdg.GameButton)]
+
+
+def test_interrupted_transition_prebuilds_current_screen(tmp_path, monkeypatch):
+    """
+    Clicks a GameButton while the screen it leads to is still fading in: once the next transition is complete, the
+    screens assembled in advance must be the ones of the screen shown, not of the one left during the fading
+    """
+    monkeypatch.chdir(ROOT)
+    from kivy.clock import Clock
+    import main
+    from save_manager import SaveManager
+
+    app = main.FogApp()
+    app.saves = SaveManager(str(tmp_path / "saved_game.journal"))
+    app.adaptive_transitions = False  # a transition must last long enough to be interrupted
+    state: dict = {"step": "setup", "elapsed": 0.0}
+
+    def is_idle() -> bool:
+        return (isinstance(app.sm.current_screen, main.wdg.GameScreen) and not app.sm.transition.is_active
+                and app._prepare_event is None and bool(app.prepared))
+
+    def poll(dt) -> bool:
+        state["elapsed"] += dt
+        if state["elapsed"] > TIMEOUT:
+            app.stop()
+            return False
+        if state["step"] == "setup" and isinstance(app.sm.current_screen, main.wdg.LanguageMenu):
+            app.language = "english"
+            app.setup_game("languages/Fog.json")
+            state["step"] = "start"
+        elif state["step"] == "start" and isinstance(app.sm.current_screen, main.wdg.StartMenu):
+            app.start_game()
+            state["step"] = "first click"
+        elif state["step"] == "first click" and is_idle():
+            get_gamebuttons(app.sm.current_screen)[0].dispatch("on_release")
+            state["step"] = "interrupting click"
+        elif state["step"] == "interrupting click":
+            state["interrupted"] = app.sm.transition.is_active
+            get_gamebuttons(app.sm.current_screen)[0].dispatch("on_release")
+            state["step"] = "check"
+        elif state["step"] == "check" and is_idle():
+            state["prepared"] = set(app.prepared)
+            state["buttons"] = set(get_gamebuttons(app.sm.current_screen))
+            state["shown"] = [prepared.screen for prepared in app.prepared.values()
+                              if prepared.screen in app.sm.screens]
+            app.stop()
+            return False
+        return True
+
+    Clock.schedule_interval(poll, 0.05)
+    app.run()
+    assert state["step"] == "check", f"timed out at {state['step']}"
+    assert state["interrupted"]
+    assert state["prepared"] == state["buttons"]
+    assert not state["shown"]
@@ -0,0 +1,55 @@
+from threading import Thread
+
+from save_manager import SaveManager
+
+STATE: dict = {"scene": 1, "variables": {"lantern": 0}}
+
+
+def get_choice(scene: int) -> dict:
+    return {"scene": scene, "set": {"lantern": scene}}
+
+
+def test_journal_without_readable_snapshot_is_no_saved_game(tmp_path):
+    journal = tmp_path / "saved_game.journal"
+    journal.write_text('{"choice":{"scene":2,"set":{}}}\n{"snaps')
+    saves = SaveManager(str(journal))
+    assert not saves.exists
+    assert saves.load() is None
+
+
+def test_journal_cut_after_a_snapshot_is_loaded(tmp_path):
+    journal = tmp_path / "saved_game.journal"
+    journal.write_text('{"snapshot":{"scene":1,"variables":{}}}\n{"choice":{"scene":2,"set":{}}}\n{"cho')
+    saves = SaveManager(str(journal))
+    assert saves.exists
+    assert saves.load() == ({"scene": 1, "variables": {}}, [{"scene": 2, "set": {}}])
+
+
+def test_writer_survives_errors_and_rewrites_the_journal(tmp_path, monkeypatch):
+    filename: str = str(tmp_path / "saved_game.journal")
+    saves = SaveManager(filename)
+    write = saves._write
+    errors: list[Exception] = [TypeError("not serializable")]
+
+    def failing_write(*args):
+        if errors:
+            raise errors.pop()
+        write(*args)
+
+    monkeypatch.setattr(saves, "_write", failing_write)
+    saves.begin(STATE)
+    saves.save(get_choice(2), lambda: STATE)
+    saves.flush()  # returns although the write failed
+    assert saves._writer.is_alive()
+    saves.save(get_choice(3), lambda: STATE)
+    saves.flush()
+    assert SaveManager(filename).load() == (STATE, [get_choice(2), get_choice(3)])
+
+
+def test_flush_does_not_wait_for_a_dead_writer(tmp_path):
+    saves = SaveManager(str(tmp_path / "saved_game.journal"))
+    saves._writer = Thread(target=lambda: None)
+    saves._writer.start()
+    saves._writer.join()
+    saves._lines = ['{"choice":{}}']
+    saves.flush()
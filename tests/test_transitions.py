@@ -0,0 +1,75 @@
+import pytest
+
+import transitions
+from transitions import MIN_SCALE, RECOVER_AFTER, TransitionTuner
+
+
+class FakeClock:
+    """
+    Clock whose frame time is set by the test. Scheduled callbacks run right away
+    """
+    frametime: float = transitions.FRAME_BUDGET
+
+    @staticmethod
+    def schedule_once(callback, timeout=0):
+        callback(0)
+
+
+@pytest.fixture
+def tuner(monkeypatch) -> TransitionTuner:
+    from kivy.uix.screenmanager import ScreenManager
+    monkeypatch.setattr(transitions, "Clock", FakeClock)
+    return TransitionTuner(ScreenManager(), "content")
+
+
+def run_transition(tuner: TransitionTuner, frame_time: float, frames: int = 10) -> None:
+    """
+    Feeds a whole transition to the tuner, every frame lasting frame_time
+    """
+    FakeClock.frametime = frame_time
+    transition = tuner.manager.transition
+    tuner._on_progress(transition, 0)
+    for frame in range(1, frames + 1):
+        tuner._on_progress(transition, frame / frames)
+    tuner._on_complete(transition)
+
+
+def test_slow_frames_shorten_then_drop_the_transition(tuner):
+    run_transition(tuner, 0.1)
+    assert tuner.level == "content" and tuner.scale < 1.0
+    while tuner.level == "content":
+        run_transition(tuner, 0.1)
+    assert tuner.level == "none" and tuner.get_duration(0.4) == 0.0
+
+
+def test_dropped_transition_is_tried_again(tuner):
+    while tuner.level == "content":
+        run_transition(tuner, 0.1)
+    for _ in range(tuner.recover_after):
+        run_transition(tuner, 0.0)
+    assert tuner.level == "content" and tuner.scale == MIN_SCALE
+    run_transition(tuner, 0.1)  # still too slow: dropped again, and tried less often
+    assert tuner.level == "none" and tuner.recover_after == 4 * RECOVER_AFTER
+    for _ in range(10):
+        run_transition(tuner, 0.0)
+    assert tuner.level == "none"
+
+
+def test_recovery_never_exceeds_the_initial_transition(tuner):
+    for _ in range(3 * RECOVER_AFTER):
+        run_transition(tuner, 0.0)
+    assert tuner.level == "content" and tuner.scale == 1.0
+
+
+def test_stopped_busy_and_ignored_transitions_are_not_measured(tuner):
+    tuner.manager.transition.is_active = True  # completed by stop()
+    run_transition(tuner, 0.1)
+    tuner.manager.transition.is_active = False
+    tuner.is_busy = lambda: True
+    run_transition(tuner, 0.1)
+    tuner.is_busy = None
+    tuner.ignore_next()
+    run_transition(tuner, 0.1)
+    assert tuner.level == "content" and tuner.scale == 1.0
+    run_transition(tuner, 0.1)
+    assert tuner.scale < 1.0
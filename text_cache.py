@@ -0,0 +1,114 @@
+##################################################################################################################
+##                                    RENDERED TEXT CACHE                                                       ##
+##################################################################################################################
+
+# Texture of every text rendered by the in-game labels and buttons (see CachedTextMixin in widgets.py), keyed by
+# everything the rendering depends on: formatted text, alignment, width, font, font size, color and padding. The core
+# label that rendered each texture is kept with it, as Kivy fills textures on their first draw and re-renders them
+# through their core label when the OpenGL context is lost (e.g. on Android when the app is resumed).
+# Textures are evicted least recently used first once their size exceeds the byte budget, and the whole cache is
+# dropped when the window is resized, as no width of the old size is used anymore. Heights measured without
+# rendering (see GameTextChunk) are kept as well, so a scene shown again is displayed without laying out its texts.
+# Hits, misses and bytes kept are reported as counters of the trace when tracing (see tracing.py).
+
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from kivy.core.text import LabelBase
+from kivy.graphics.texture import Texture
+
+import tracing
+
+BUDGET: int = 32 * 1024 * 1024  # bytes of texture kept, RGBA
+MAX_HEIGHTS: int = 4096  # measured heights kept
+
+
+class TextTextureCache:
+    """
+    LRU cache of rendered text textures under a byte budget
+    """
+    def __init__(self, budget: int = BUDGET, max_heights: int = MAX_HEIGHTS):
+        self.budget: int = budget
+        self.max_heights: int = max_heights
+        self.labels: OrderedDict[Hashable, LabelBase] = OrderedDict()  # core labels, least recently used first
+        self.heights: OrderedDict[Hashable, float] = OrderedDict()
+        self.size: int = 0  # bytes of the textures kept
+        self.hits: int = 0  # lookups finding their texture, see get()
+        self.misses: int = 0
+
+    @staticmethod
+    def get_bytes(texture: Texture) -> int:
+        return texture.width * texture.height * 4
+
+    def get(self, key: Hashable) -> Optional[Texture]:
+        """
+        Gets the texture of a rendered text
+        :param key: key of the text, see CachedTextMixin.get_text_key()
+        :return: the texture, None if not cached
+        """
+        label: Optional[LabelBase] = self.labels.get(key)
+        if label is None:
+            self.misses += 1
+        else:
+            self.labels.move_to_end(key)
+            self.hits += 1
+        if tracing.ENABLED:
+            tracing.counter("text cache lookups", {"hits": self.hits, "misses": self.misses})
+        return None if label is None else label.texture
+
+    def put(self, key: Hashable, label: LabelBase) -> None:
+        """
+        Keeps the texture of a rendered text and evicts the least recently used ones beyond the budget
+        :param key: key of the text, see CachedTextMixin.get_text_key()
+        :param label: core label that rendered the text. It must not render any other text afterwards
+        :return: None
+        """
+        if key in self.labels:
+            self.size -= self.get_bytes(self.labels.pop(key).texture)
+        size: int = self.get_bytes(label.texture)
+        if size > self.budget:
+            return
+        self.labels[key] = label
+        self.size += size
+        while self.size > self.budget:
+            self.size -= self.get_bytes(self.labels.popitem(last=False)[1].texture)
+        if tracing.ENABLED:
+            tracing.counter("text cache bytes", {"bytes": self.size})
+
+    def get_height(self, key: Hashable) -> Optional[float]:
+        """
+        Gets the height of a text, from its texture or from a former measurement
+        :param key: key of the text, see CachedTextMixin.get_text_key()
+        :return: the height, None if unknown
+        """
+        label: Optional[LabelBase] = self.labels.get(key)
+        if label is not None:
+            return label.texture.height
+        height: Optional[float] = self.heights.get(key)
+        if height is not None:
+            self.heights.move_to_end(key)
+        return height
+
+    def put_height(self, key: Hashable, height: float) -> None:
+        """
+        Keeps the measured height of a text
+        :param key: key of the text, see CachedTextMixin.get_text_key()
+        :param height: height of the text once rendered
+        :return: None
+        """
+        self.heights[key] = height
+        self.heights.move_to_end(key)
+        if len(self.heights) > self.max_heights:
+            self.heights.popitem(last=False)
+
+    def clear(self, *args) -> None:
+        """
+        Drops all textures and heights, e.g. when the window is resized
+        :param args: Added for consistency (passed when bound to the size of the window)
+        :return: None
+        """
+        self.labels.clear()
+        self.heights.clear()
+        self.size = 0
+        if tracing.ENABLED:
+            tracing.counter("text cache bytes", {"bytes": self.size})
@@ -0,0 +1,135 @@
+##################################################################################################################
+##                                    SPAN TRACING                                                              ##
+##################################################################################################################
+
+# Opt-in tracing of the hot paths of the app. Run with FOG_TRACE=<output.json> (or FOG_TRACE=1 for fog_trace.json)
+# to record a span for every call of the methods decorated with @traced, plus the duration of every frame of the
+# Kivy Clock and the counters reported by caches (e.g. hits of TextTextureCache). The last FOG_TRACE_CAPACITY events
+# (100000 by default) are kept in a ring buffer and written in Chrome trace-event format when the app stops: open
+# the file in chrome://tracing or https://ui.perfetto.dev. When FOG_TRACE is not set, @traced returns the methods
+# untouched and counters are not reported, so tracing costs nothing.
+
+import json
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from time import perf_counter_ns
+from typing import Callable, ContextManager, Optional
+
+_setting: str = os.environ.get("FOG_TRACE", "")
+ENABLED: bool = _setting not in ("", "0")
+TRACE_PATH: str = "fog_trace.json" if _setting in ("", "0", "1") else _setting
+CAPACITY: int = int(os.environ.get("FOG_TRACE_CAPACITY", 100000))
+
+FRAMES_TID: int = 0  # frames are shown on their own track
+
+_events: deque = deque(maxlen=CAPACITY)  # oldest events are dropped once full
+_pid: int = os.getpid()
+
+
+def _now() -> float:
+    return perf_counter_ns() / 1000  # monotonic, in microseconds as the trace format expects
+
+
+def record(name: str, start: float, end: float, tid: Optional[int] = None) -> None:
+    """
+    Records a complete span. Spans of the same thread nest according to their timestamps
+    :param name: name of the span
+    :param start: start time in microseconds (see _now())
+    :param end: end time in microseconds
+    :param tid: track of the span, thread of the caller by default
+    :return: None
+    """
+    _events.append({"name": name, "ph": "X", "ts": start, "dur": end - start, "pid": _pid,
+                    "tid": threading.get_ident() if tid is None else tid})
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """
+    Decorator recording a span for every call of a function, if tracing is enabled
+    :param name: name of the span, qualified name of the function by default
+    :return: the decorator
+    """
+    def decorator(function: Callable) -> Callable:
+        if not ENABLED:
+            return function
+        span_name: str = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start: float = _now()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(span_name, start, _now())
+        return wrapper
+    return decorator
+
+
+def counter(name: str, values: dict[str, float]) -> None:
+    """
+    Records the values of a counter, charted over time, if tracing is enabled
+    :param name: name of the counter
+    :param values: {series: value}, e.g. {"hits": 10, "misses": 2}
+    :return: None
+    """
+    if ENABLED:
+        _events.append({"name": name, "ph": "C", "ts": _now(), "pid": _pid, "args": values})
+
+
+def span(name: str) -> ContextManager:
+    """
+    Context manager recording a span for a block of code, if tracing is enabled
+    :param name: name of the span
+    :return: the context manager
+    """
+    return _span(name) if ENABLED else nullcontext()
+
+
+@contextmanager
+def _span(name: str):
+    start: float = _now()
+    try:
+        yield
+    finally:
+        record(name, start, _now())
+
+
+def start_frame_tracing() -> None:
+    """
+    Records the duration of every frame of the Kivy Clock, if tracing is enabled
+    :return: None
+    """
+    if not ENABLED:
+        return
+    from kivy.clock import Clock
+
+    last_frame: list[float] = [_now()]
+
+    def on_frame(dt) -> None:
+        now: float = _now()
+        record("frame", last_frame[0], now, tid=FRAMES_TID)
+        last_frame[0] = now
+
+    Clock.schedule_interval(on_frame, 0)  # every frame
+
+
+def dump(trace_path: str = TRACE_PATH) -> None:
+    """
+    Writes the recorded events in Chrome trace-event JSON, if tracing is enabled. The file is written under a
+    temporary name and then renamed
+    :param trace_path: path of the trace file
+    :return: None
+    """
+    if not ENABLED:
+        return
+    metadata: list[dict] = [{"name": "thread_name", "ph": "M", "pid": _pid, "tid": FRAMES_TID,
+                             "args": {"name": "frames"}},
+                            {"name": "thread_name", "ph": "M", "pid": _pid, "tid": threading.main_thread().ident,
+                             "args": {"name": "main"}}]
+    tmp_path: str = trace_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"traceEvents": metadata + list(_events), "displayTimeUnit": "ms"}, f)
+    os.replace(tmp_path, trace_path)
@@ -0,0 +1,179 @@
+##################################################################################################################
+##                                    SCREEN TRANSITIONS                                                        ##
+##################################################################################################################
+
+# FadeTransition renders both screens into framebuffers on every frame of the fading, which low-end GPUs struggle
+# with, more so with the long ScrollView of a GameScreen. ContentFadeTransition hides the outgoing screen at once
+# and only fades in the content (ScreenLayout) of the incoming one, through its opacity: no framebuffer is used.
+# TransitionTuner measures the frame times during each transition. When too many frames miss the frame budget it
+# shortens the next transitions, and once they are as short as allowed it drops to a cheaper transition
+# (fade -> content -> none). Durations passed to it are targets, reached again while frames keep up, and after
+# RECOVER_AFTER transitions keeping up at full duration the former transition is tried again. Transitions cut short
+# by another one, or overlapping other work of the app (see TransitionTuner.is_busy), are not measured.
+
+from functools import partial
+from typing import Callable, Optional
+
+from kivy.clock import Clock, ClockEvent
+from kivy.uix.screenmanager import FadeTransition, NoTransition, Screen, ScreenManager, TransitionBase
+from kivy.uix.widget import Widget
+
+FRAME_BUDGET: float = 1 / 60  # in seconds
+MISSED_FRAME: float = 1.5 * FRAME_BUDGET  # frames longer than this missed the budget
+MAX_MISSED: float = 0.25  # fraction of missed frames above which transitions are made cheaper
+MIN_SAMPLES: int = 3  # transitions with fewer frames measured are not taken into account
+MIN_SCALE: float = 0.4  # shortest duration, as a fraction of the target
+SHORTEN: float = 0.7  # duration scale after a transition missing its budget
+RECOVER: float = 1.1  # duration scale after a transition keeping up with its budget
+RECOVER_AFTER: int = 8  # transitions keeping up at full duration before trying the former transition again
+LEVELS: tuple[str, ...] = ("fade", "content", "none")  # from the most to the least expensive
+
+
+class ContentFadeTransition(TransitionBase):
+    """
+    Transition fading in the content of the incoming screen (the ScreenLayout of a GameScreen, the whole screen
+    otherwise). The outgoing screen is hidden as soon as the transition starts
+    """
+    @staticmethod
+    def get_content(screen: Screen) -> Widget:
+        """
+        Gets the widget faded in
+        :param screen: incoming screen
+        :return: ScreenLayout of a GameScreen, else the screen itself
+        """
+        return getattr(screen, "layout", screen)
+
+    def start(self, manager: ScreenManager) -> None:
+        self.screen_out.opacity = 0.0
+        self.get_content(self.screen_in).opacity = 0.0
+        super().start(manager)
+
+    def on_progress(self, progression: float) -> None:
+        self.get_content(self.screen_in).opacity = progression
+
+    def on_complete(self) -> None:
+        self.get_content(self.screen_in).opacity = 1.0
+        super().on_complete()
+        self.screen_out.opacity = 1.0  # screens are reused (see GameScreenPool)
+
+
+class TransitionTuner:
+    """
+    Sets the transition of a ScreenManager and adapts its duration and kind to the frame times measured
+    """
+    def __init__(self, manager: ScreenManager, level: str = "content", adaptive: bool = True,
+                 on_complete: Optional[Callable] = None, is_busy: Optional[Callable[[], bool]] = None):
+        self.manager: ScreenManager = manager
+        self.adaptive: bool = adaptive  # if False, transitions always last their target duration
+        self.on_complete: Optional[Callable] = on_complete  # bound to the on_complete event of every transition
+        # if it returns True during a transition (e.g. screens assembled meanwhile), the transition is not measured
+        self.is_busy: Optional[Callable[[], bool]] = is_busy
+        self.scale: float = 1.0  # duration of the transitions, as a fraction of their target
+        self.level: str = level
+        self.max_level: str = level  # most expensive transition, never exceeded when recovering
+        self.recover_after: int = RECOVER_AFTER  # doubled every time a transition is dropped
+        self._kept_up: int = 0  # transitions in a row keeping up at full duration
+        self._frame_times: list[float] = []
+        self._measured: bool = True  # if False, the frames of the current transition are not taken into account
+        self._ignore_next: bool = False
+        self._level_event: Optional[ClockEvent] = None
+        self._set_transition(level)
+
+    def _set_transition(self, level: str) -> None:
+        """
+        Sets the transition of the ScreenManager
+        :param level: kind of transition, see LEVELS
+        :return: None
+        """
+        transition: TransitionBase = {"fade": FadeTransition, "content": ContentFadeTransition,
+                                      "none": NoTransition}[level]()
+        transition.bind(on_progress=self._on_progress, on_complete=self._on_complete)
+        if self.on_complete is not None:
+            transition.bind(on_complete=self.on_complete)
+        self.level = level
+        self.manager.transition = transition
+
+    def get_duration(self, target: float) -> float:
+        """
+        Gets the duration of the next transition
+        :param target: duration wanted, in seconds
+        :return: duration, shorter than the target on devices missing their frame budget
+        """
+        return 0.0 if self.level == "none" else target * self.scale
+
+    def ignore_next(self) -> None:
+        """
+        Does not measure the next transition, e.g. the first screen of a game, faded in while fonts, textures and
+        soundtracks are still being loaded
+        :return: None
+        """
+        self._ignore_next = True
+
+    def _on_progress(self, transition: TransitionBase, progression: float) -> None:
+        if progression == 0:  # dispatched by start()
+            self._frame_times = []
+            self._measured, self._ignore_next = not self._ignore_next, False
+            return
+        if self.is_busy is not None and self.is_busy():
+            self._measured = False
+        if self._measured:
+            self._frame_times.append(Clock.frametime)
+
+    def _on_complete(self, transition: TransitionBase) -> None:
+        """
+        Shortens or lengthens the next transitions according to the frames missed during the last one, and changes
+        the kind of transition when they are as short as allowed or have kept up for long enough
+        :param transition: transition completed
+        :return: None
+        """
+        frame_times, self._frame_times = self._frame_times[1:], []  # the first frame includes assembling the screen
+        # stop() completes the transition while still active: it was cut short by the next one
+        if not self.adaptive or not self._measured or transition.is_active:
+            return
+        if self.level == LEVELS[-1]:  # nothing to measure
+            self._keep_up()
+            return
+        if len(frame_times) < MIN_SAMPLES:
+            return
+        missed: float = sum(frame_time > MISSED_FRAME for frame_time in frame_times) / len(frame_times)
+        if missed <= MAX_MISSED:
+            self.scale = min(1.0, self.scale * RECOVER)
+            if self.scale == 1.0:
+                self._keep_up()
+            return
+        self._kept_up = 0
+        if self.scale > MIN_SCALE:
+            self.scale = max(MIN_SCALE, self.scale * SHORTEN)
+        else:
+            self.recover_after *= 2  # a device dropping the same transition again tries it less and less often
+            self._schedule_level(LEVELS[LEVELS.index(self.level) + 1], 1.0)
+
+    def _keep_up(self) -> None:
+        """
+        Counts a transition keeping up at full duration, and tries the former transition again after enough of them
+        :return: None
+        """
+        self._kept_up += 1
+        if self._kept_up >= self.recover_after and self.level != self.max_level:
+            self._kept_up = 0
+            # tried at its shortest, so it costs little if it still misses the budget
+            self._schedule_level(LEVELS[LEVELS.index(self.level) - 1], MIN_SCALE)
+
+    def _schedule_level(self, level: str, scale: float) -> None:
+        """
+        Changes the kind of transition once no transition is running (not while the ScreenManager completes one)
+        :param level: kind of transition, see LEVELS
+        :param scale: duration of the transitions, as a fraction of their target
+        :return: None
+        """
+        if self._level_event is not None:
+            self._level_event.cancel()
+        self._level_event = Clock.schedule_once(partial(self._set_level, level, scale), 0)
+
+    def _set_level(self, level: str, scale: float, dt) -> None:
+        if self.manager.transition.is_active:  # never cut a transition short, which stop() would do
+            self._level_event = Clock.schedule_once(partial(self._set_level, level, scale), 0)
+            return
+        self._level_event = None
+        self.scale = scale
+        self._set_transition(level)
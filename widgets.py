@@ -1,5 +1,9 @@
+from copy import copy
 from typing import Optional
 
+from kivy.clock import Clock
+from kivy.core.text.markup import MarkupLabel as CoreMarkupLabel
+from kivy.properties import BooleanProperty, NumericProperty, StringProperty
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.label import Label
@@ -8,6 +12,10 @@ from kivy.uix.image import Image
 from kivy.uix.screenmanager import Screen
 from kivy.animation import Animation
 from kivy.uix.togglebutton import ToggleButton
+from kivy.graphics.texture import Texture
+
+import tracing
+from text_cache import TextTextureCache
 
 
 # ALL EMPTY CLASSES ARE DEFINED IN THE KV FILE. THE OTHERS MAY BE EXTENDED THERE AS WELL
@@ -26,9 +34,9 @@ class BaseButton(Button):
 
 class LoadingScreen(Screen):
     """
-    Screen to show when game is setting up
+    Screen to show when game is setting up, with the progress of the load (see FogApp.setup_game())
     """
-    pass
+    progress = NumericProperty(0.0)  # from 0 to 1
 
 class FadingMixin:
     """
@@ -54,6 +62,45 @@ class FadingMixin:
             fading.bind(on_complete=self.on_fading_complete)
         fading.start(self)
 
+class CachedTextMixin:
+    """
+    Mixin class for Labels (and Buttons) taking their textures from CachedTextMixin.cache, set by FogApp, so a text
+    already rendered with the same width and font is not laid out again.
+    Usage example -> class GameTextLabel(CachedTextMixin, Label):
+    """
+    cache: Optional[TextTextureCache] = None
+
+    def get_text_key(self, text: str) -> tuple:
+        """
+        Gets the key of a text in the TextTextureCache: everything its texture depends on
+        :param text: formatted text
+        :return: the key
+        """
+        return (text, self.halign, self.valign, self.text_size[0], self.font_name, self.font_size,
+                tuple(self.disabled_color if self.disabled else self.color), tuple(self.padding))
+
+    def texture_update(self, *largs) -> None:
+        """
+        Takes the texture from the cache if the text was already rendered, else renders it and caches its texture
+        :param largs: see Label.texture_update()
+        :return: None
+        """
+        cache: Optional[TextTextureCache] = CachedTextMixin.cache
+        if cache is None or not self.text or self.text_size[0] is None:  # unbounded texts are never reused
+            super().texture_update(*largs)
+            return
+        key: tuple = self.get_text_key(self.text)
+        texture: Optional[Texture] = cache.get(key)
+        if texture is None:
+            super().texture_update(*largs)
+            if self.texture is not None and self.texture is self._label.texture and self.texture.width > 1:
+                cache.put(key, self._label)
+                self._label = None
+                self._create_label()  # the cached core label must keep its text, see TextTextureCache
+            return
+        self.texture = texture
+        self.texture_size = list(texture.size)
+
 class TitleLabel(FadingMixin, Label):
     """
     Special Label for displaying the title of the Game in the StartMenu
@@ -85,6 +132,7 @@ class InterfaceLayout(FadingMixin, BoxLayout):
             self.children[0].state = "down"  # MusicButton always shows up pressed
             self._fade_in(self.duration)
 
+    @tracing.traced()
     def update_locationlabel(self, text: str) -> None:
         """
         Sets the text of the LocaltionLabel
@@ -97,9 +145,10 @@ class InterfaceLayout(FadingMixin, BoxLayout):
 
 class GameImage(Image):
     """
-    Displays in-game images
+    Displays in-game images. Textures are set directly from ImageCache (no source), so no file is read.
+    Pictures are laid out at the height of their source even when shown from a smaller variant
     """
-    pass
+    source_height = NumericProperty(None, allownone=True)  # if None, height of the texture
 
 class RootLayout(BoxLayout):
     """
@@ -149,12 +198,68 @@ class GameButtonLayout(BaseButtonLayout):
     """
     pass
 
-class GameTextLabel(Label):
+class GameTextLabel(CachedTextMixin, Label):
     """
     Label for in-game texts
     """
     pass
 
+class GameTextChunk(CachedTextMixin, Label):
+    """
+    Label for one paragraph of an in-game text (see json_utils.split_paragraphs()), used when texts are virtualized.
+    Its height is measured without rendering the text, and its text (so its texture) is only set while visible,
+    see GameScreen.update_visible_chunks()
+    """
+    chunk_text = StringProperty("")  # paragraph to display when visible
+    visible = BooleanProperty(False)
+    measurer: Optional[CoreMarkupLabel] = None  # shared by all chunks, never creates textures
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._trigger_measure = Clock.create_trigger(self.measure_height, -1)
+        self.bind(width=self._trigger_measure, chunk_text=self._trigger_measure, halign=self._trigger_measure,
+                  font_size=self._trigger_measure)
+        self._trigger_measure()
+
+    def measure_height(self, *args) -> None:
+        """
+        Sets the height the paragraph takes once rendered with the current width, without rendering it
+        :param args: Added for consistency (passed by the Clock trigger and the bound properties)
+        :return: None
+        """
+        if not self.chunk_text:
+            self.height = 0
+            return
+        key: tuple = self.get_text_key(self.chunk_text)
+        height: Optional[float] = self.cache.get_height(key) if self.cache is not None else None
+        if height is None:
+            if GameTextChunk.measurer is None:
+                GameTextChunk.measurer = CoreMarkupLabel()
+            measurer: CoreMarkupLabel = GameTextChunk.measurer
+            measurer.options = copy(self._label.options)  # same font, size, alignment and padding as the rendering
+            measurer.text_size = (self.text_size[0], None)
+            measurer.text = self.chunk_text
+            measurer.resolve_font_name()
+            height = measurer.render()[1]
+            if self.cache is not None:
+                self.cache.put_height(key, height)
+        self.height = height
+
+    def on_chunk_text(self, instance, chunk_text: str) -> None:
+        if self.visible:
+            self.text = chunk_text
+
+    def on_visible(self, instance, visible: bool) -> None:
+        """
+        Renders the paragraph when it becomes visible and drops its texture when it is hidden
+        :param instance: GameTextChunk instance
+        :param visible: if True, the paragraph is near the viewport of the ScrollView
+        :return: None
+        """
+        self.text = self.chunk_text if visible else ""
+        if not visible:
+            self._label.texture = None  # the core label would otherwise keep the last texture
+
 class LocationLabel(Label):
     """
     Label for displaying the location of each scene during the game
@@ -167,14 +272,21 @@ class MusicButton(ToggleButton):
     """
     pass
 
-class GameButton(BaseButton):
+class UndoButton(Button):
+    """
+    Button for undoing the last choice of the game. Disabled while there is no choice to undo (see FogApp.can_undo)
+    """
+    pass
+
+class GameButton(CachedTextMixin, BaseButton):
     """
     Buttons displayed during the game, not in the Menus
     """
-    def __init__(self, destination_scene_id: int, consequences: dict, **kwargs):
+    def __init__(self, destination_scene_id: int, consequences: tuple[tuple[int, int], ...], **kwargs):
         super().__init__(**kwargs)
         self.destination_scene_id: int = destination_scene_id
-        self.consequences: dict = consequences
+        self.consequences: tuple[tuple[int, int], ...] = consequences  # compiled (slot, value) pairs
+        self.on_release_callback: Optional[callable] = None  # bound by GameScreenPool.get_button()
 
 class MenuButton(BaseButton):
     """
@@ -306,24 +418,184 @@ class StartMenu(Screen):
 
 class GameScreen(Screen):  # defined in the kv file
     """
-    Class defining the Screen showing the game, consisting of a ScreenLayout embedded in an ScrollView
+    Class defining the Screen showing the game, consisting of a ScreenLayout embedded in an ScrollView.
+    GameScreens are reused (see GameScreenPool), so the layouts for texts, images and buttons are created only once
     """
+    VISIBLE_CHARACTERS: int = 3000  # characters of text rendered before the GameScreen is laid out
+
     def __init__(self, adapt_height: bool, **kwargs):
         super().__init__(**kwargs)
         self.height_mod = 0.8  # do not use size_hint_y, does not work, although it theoretically does the same
-        self.layout: ScreenLayout = ScreenLayout()  # contains text and button layouts added by place_text() and place_buttons()
-        scroll: ScrollView = ScrollView()
-        scroll.add_widget(self.layout)
-        self.add_widget(scroll)
-
-        if adapt_height:
-            self.bind(on_pre_enter=self._adapt_height)
+        self.adapt_height: bool = adapt_height
+        self.layout: ScreenLayout = ScreenLayout()  # contains text and button layouts filled by place_text() and place_buttons()
+        self.text_image_layout: GameTextImageLayout = GameTextImageLayout()
+        self.button_layout: GameButtonLayout = GameButtonLayout()
+        self.layout.add_widget(self.text_image_layout)
+        self.layout.add_widget(self.button_layout)
+        self.scroll: ScrollView = ScrollView()
+        self.scroll.add_widget(self.layout)
+        self.add_widget(self.scroll)
+        self.bind(on_pre_enter=self._adapt_height)
+        # GameTextChunks are shown and hidden as the ScrollView scrolls, once positions are updated (next frame)
+        self._trigger_visible_chunks = Clock.create_trigger(self.update_visible_chunks, 0)
+        self.scroll.bind(scroll_y=self._trigger_visible_chunks, height=self._trigger_visible_chunks)
+        self.text_image_layout.bind(pos=self._trigger_visible_chunks, height=self._trigger_visible_chunks)
 
     def _adapt_height(self, *args) -> None:
         """
         Adjust the height of the GameScreen before FadingTransition starts to avoid interference with the upper
-        interface bar while fading in
+        interface bar while fading in (only if GameScreen.adapt_height)
         :param args: Added for consistency, nothing is actually passed
         :return: None
         """
-        self.height *= self.height_mod
+        if self.adapt_height:
+            self.height *= self.height_mod
+
+    def update_visible_chunks(self, *args) -> None:
+        """
+        Renders the GameTextChunks within one ScrollView height of the viewport and hides the others, so texture
+        memory does not grow with the length of the scene. Until the GameScreen is displayed, the first
+        VISIBLE_CHARACTERS characters are rendered, so the first frame shown is not empty
+        :param args: Added for consistency (passed by the Clock trigger)
+        :return: None
+        """
+        chunks: list[GameTextChunk] = [widget for widget in reversed(self.text_image_layout.children)
+                                       if isinstance(widget, GameTextChunk)]
+        if self.get_root_window() is None:  # not laid out yet
+            characters: int = 0
+            for chunk in chunks:
+                chunk.visible = characters < self.VISIBLE_CHARACTERS
+                characters += len(chunk.chunk_text)
+            return
+        margin: float = self.scroll.height
+        bottom: float = self.scroll.to_local(self.scroll.x, self.scroll.y)[1]  # viewport, in content coordinates
+        for chunk in chunks:
+            chunk.visible = chunk.top >= bottom - margin and chunk.y <= bottom + self.scroll.height + margin
+
+class GameScreenPool:
+    """
+    Keeps the GameScreens no longer displayed (released) and hands them out again when a new GameScreen is needed.
+    Widgets of a GameScreen are recycled when the GameScreen is used again, so no widgets are created (and no kv rules
+    applied) once the pool is warm
+    """
+    def __init__(self):
+        self.screens: list[GameScreen] = []  # released screens, ready to be reused
+        self.labels: list[GameTextLabel] = []  # free widgets, ready to be reused
+        self.chunks: list[GameTextChunk] = []
+        self.buttons: list[GameButton] = []
+        self.images: list[ImageLayout] = []
+
+    @tracing.traced()
+    def get_screen(self, name: str, adapt_height: bool) -> GameScreen:
+        """
+        Gets a released GameScreen (or a new one if none), emptied and scrolled to the top
+        :param name: name of the screen
+        :param adapt_height: see GameScreen.adapt_height
+        :return: the GameScreen
+        """
+        if not self.screens:
+            return GameScreen(name=name, adapt_height=adapt_height)
+        screen: GameScreen = self.screens.pop()
+        self.recycle(screen)
+        screen.name = name
+        screen.adapt_height = adapt_height
+        screen.scroll.scroll_y = 1
+        return screen
+
+    def release_screen(self, screen: GameScreen) -> None:
+        """
+        Gives back a GameScreen no longer needed. Its widgets are only recycled when the screen is used again, so a
+        screen still fading out keeps its content
+        :param screen: the GameScreen to release
+        :return: None
+        """
+        self.screens.append(screen)
+
+    def recycle(self, screen: GameScreen) -> None:
+        """
+        Removes the texts, images and buttons of a GameScreen and keeps them to be reused
+        :param screen: the GameScreen to empty
+        :return: None
+        """
+        for widget in screen.text_image_layout.children + screen.button_layout.children:
+            if isinstance(widget, GameTextLabel):
+                self.labels.append(widget)
+            elif isinstance(widget, GameTextChunk):
+                widget.visible = False  # drops its texture
+                self.chunks.append(widget)
+            elif isinstance(widget, ImageLayout):
+                self.images.append(widget)
+            elif isinstance(widget, GameButton):
+                self.buttons.append(widget)
+        screen.text_image_layout.clear_widgets()
+        screen.button_layout.clear_widgets()
+
+    def get_label(self, text: str, halign: str) -> GameTextLabel:
+        """
+        Gets a GameTextLabel, reused if possible
+        :param text: text of the label
+        :param halign: horizontal alignment of the text
+        :return: the GameTextLabel
+        """
+        if not self.labels:
+            return GameTextLabel(text=text, halign=halign)
+        label: GameTextLabel = self.labels.pop()
+        label.text = text
+        label.halign = halign
+        return label
+
+    def get_chunk(self, text: str, halign: str) -> GameTextChunk:
+        """
+        Gets a hidden GameTextChunk, reused if possible
+        :param text: paragraph of the chunk
+        :param halign: horizontal alignment of the text
+        :return: the GameTextChunk
+        """
+        if not self.chunks:
+            return GameTextChunk(chunk_text=text, halign=halign)
+        chunk: GameTextChunk = self.chunks.pop()
+        chunk.chunk_text = text
+        chunk.halign = halign
+        return chunk
+
+    def get_button(self, text: str, destination_scene_id: int, consequences: tuple[tuple[int, int], ...],
+                   on_release: callable) -> GameButton:
+        """
+        Gets a GameButton, reused if possible
+        :param text: text of the GameButton
+        :param destination_scene_id: section id where GameButton leads when pressed
+        :param consequences: compiled consequences of the pressing of the GameButton
+        :param on_release: callback bound to on_release
+        :return: the GameButton
+        """
+        if not self.buttons:
+            button = GameButton(text=text, destination_scene_id=destination_scene_id, consequences=consequences)
+        else:
+            button = self.buttons.pop()
+            button.text = text
+            button.destination_scene_id = destination_scene_id
+            button.consequences = consequences
+            button.state = "normal"
+            if button.on_release_callback != on_release:
+                button.unbind(on_release=button.on_release_callback)
+        if button.on_release_callback != on_release:
+            button.bind(on_release=on_release)
+            button.on_release_callback = on_release
+        return button
+
+    def get_image(self, texture: Optional[Texture], size: Optional[tuple[int, int]] = None) -> ImageLayout:
+        """
+        Gets an ImageLayout embedding a GameImage, reused if possible
+        :param texture: texture of the picture (see ImageCache)
+        :param size: size of the source of the picture, if the texture may be a smaller variant
+        :return: the ImageLayout
+        """
+        source_height: Optional[int] = size[1] if size is not None else None
+        if not self.images:
+            layout = ImageLayout()  # images must be embedded in BoxLayouts in order to specify padding
+            layout.add_widget(GameImage(texture=texture, source_height=source_height))
+            return layout
+        layout: ImageLayout = self.images.pop()
+        layout.children[0].texture = texture
+        layout.children[0].source_height = source_height
+        return layout